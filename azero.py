@@ -1,20 +1,61 @@
 #!/usr/bin/env python
 
+import os
+import copy
+import time
+import pickle
+import tempfile
+import multiprocessing
 import numpy as np
+from collections import deque, OrderedDict
+from math import sqrt
+from sys import getsizeof
+from metrics import NullMetrics
 from util import softmax, sample_probs
 
 
 class Tree:
     ''' Data structure used during simulated games '''
+    __slots__ = ('c_puct', 'T', 'N', 'W', 'Q', 'P', 'prior', 'score',
+                 'children', 'materialized', 'state', 'player', 'outcome',
+                 'valid', 'mask', 'order', 'next', 'touched')
+    loop_size = 12  # Most touched actions to score incrementally
+
     def __init__(self, prior, c_puct):
         self.c_puct = c_puct
         self.T = 0  # Total visits
         self.N = np.zeros(len(prior), dtype=int)  # Visit count
-        self.W = np.zeros(len(prior))  # Total action-value
-        self.Q = np.zeros(len(prior))  # Mean action-value == W / N
-        self.P = np.array(prior)  # Scaled prior == prior / (1 + N)
-        self.prior = np.array(prior)
+        # Single allocation for the float rows, each row is a view into it
+        (self.W,  # Total action-value
+         self.Q,  # Mean action-value == W / N
+         self.P,  # Scaled prior == prior / (1 + N)
+         self.prior,
+         self.score,  # Scratch space for select()
+         ) = np.zeros((5, len(prior)))
+        self.P[:] = prior
+        self.prior[:] = prior
         self.children = dict()
+        # Position of this node, filled in by materialize()
+        self.materialized = False
+        self.state = None
+        self.player = None  # None if the position is terminal
+        self.outcome = None  # Game outcome if the position is terminal
+        self.valid = None  # Boolean array of valid actions
+        # Incremental select() state, built by the first select()
+        self.mask = None  # Valid actions that order was built for
+        self.order = None  # Valid actions by decreasing prior, ties by index
+        self.next = 0  # Position in order of the first untouched action
+        self.touched = None  # Set of actions that have been visited
+
+    def materialize(self, state, player, outcome, valid):
+        ''' Cache the game position this node represents '''
+        self.materialized = True
+        self.state = state
+        self.player = player
+        self.outcome = outcome
+        if valid is not None:
+            valid = np.asarray(valid, dtype=bool)
+        self.valid = valid
 
     def leaf(self, action, prior):
         self.children[action] = Tree(prior, c_puct=self.c_puct)
@@ -28,10 +69,117 @@ class Tree:
         return self.Q + self.U
 
     def select(self, valid):
-        ''' Select given valid moves and return action, child '''
-        action = np.argmax(np.where(valid, self.values, -np.inf))
+        '''
+        Select given valid moves and return action, child.  Same result as
+        select_dense(), but only scores the actions visited so far: every
+        unvisited action has Q == 0 and P == prior, so the best of them is
+        the first valid one in order of decreasing prior.  The order only
+        holds valid actions, and is rebuilt when called with a different
+        valid array, so don't modify valid in place between calls.
+        '''
+        if self.touched is None:
+            self.touched = set(np.flatnonzero(self.N).tolist())
+        if self.T == 0 or len(self.touched) > self.loop_size:
+            # U is zero and ties go to the first valid action, or scoring
+            # all the touched actions costs more than scoring everything
+            return self.select_dense(valid)
+        if valid is not self.mask:
+            ranked = np.argsort(-self.prior, kind='stable')
+            self.order = ranked[np.asarray(valid)[ranked]].tolist()
+            self.mask = valid
+            self.next = 0
+        u = self.c_puct * sqrt(self.T)
+        order, touched = self.order, self.touched
+        i = self.next
+        while i < len(order) and order[i] in touched:
+            i += 1
+        self.next = i
+        action, best = -1, -np.inf
+        if i < len(order):
+            action = order[i]
+            best = self.prior.item(action) * u
+        P, Q = self.P, self.Q
+        for a in touched:
+            if valid[a]:
+                score = P.item(a) * u + Q.item(a)
+                if score > best or (score == best and a < action):
+                    action, best = a, score
+        return action, self.children.get(action, None)
+
+    def select_dense(self, valid):
+        ''' Select by scoring every action, see select() '''
+        # Same as argmax(where(valid, values, -inf)), without temporaries
+        score = self.score
+        score.fill(-np.inf)
+        np.multiply(self.P, self.c_puct * sqrt(self.T), out=score, where=valid)
+        np.add(score, self.Q, out=score, where=valid)
+        action = score.argmax()
         return action, self.children.get(action, None)
 
+    def subtree(self, action, max_nodes=None):
+        '''
+        Detach the child for action to re-use as the next root.
+        Optionally prune it to at most max_nodes nodes.
+        Returns None if the child was never expanded.
+        '''
+        child = self.children.get(action, None)
+        if child is not None and max_nodes is not None:
+            child.prune(max_nodes)
+        return child
+
+    def prune(self, max_nodes):
+        ''' Drop all nodes past the first max_nodes in breadth-first order '''
+        queue = deque([self])
+        kept = {id(self)}
+        while queue:
+            node = queue.popleft()
+            # Keep the most visited children first
+            for action in sorted(node.children, key=lambda a: -node.N[a]):
+                child = node.children[action]
+                if id(child) in kept:  # Transposition, see TranspositionTable
+                    continue
+                if len(kept) < max_nodes:
+                    kept.add(id(child))
+                    queue.append(child)
+                else:
+                    del node.children[action]
+
+    def nodes(self):
+        ''' Iterate over all nodes in this tree '''
+        stack = [self]
+        seen = {id(self)}  # Nodes can be shared, see TranspositionTable
+        while stack:
+            node = stack.pop()
+            yield node
+            for child in node.children.values():
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    stack.append(child)
+
+    def size(self):
+        ''' Number of nodes in this tree '''
+        return sum(1 for _ in self.nodes())
+
+    def depth(self):
+        ''' Number of nodes on the longest path down from this node '''
+        depth = 0
+        stack = [(self, 1)]
+        seen = {id(self)}
+        while stack:
+            node, d = stack.pop()
+            depth = max(depth, d)
+            for child in node.children.values():
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    stack.append((child, d + 1))
+        return depth
+
+    def nbytes(self):
+        ''' Approximate memory used by this tree, in bytes '''
+        return sum(getsizeof(node) + getsizeof(node.children) +
+                   node.N.nbytes + node.W.base.nbytes
+                   for node in self.nodes())
+
     def backup(self, action, value):
         ''' Backup results of a simulation game '''
         self.T += 1
@@ -39,6 +187,104 @@ class Tree:
         self.W[action] = w = self.W[action] + value
         self.Q[action] = w / n
         self.P[action] = self.prior[action] / (1 + n)
+        if n == 1 and self.touched is not None:
+            self.touched.add(int(action))
+
+    def add_loss(self, action, loss):
+        ''' Apply a virtual loss to discourage other pending descents '''
+        self.backup(action, -loss)
+
+    def revert_loss(self, action, loss):
+        ''' Remove a virtual loss previously applied with add_loss() '''
+        self.T -= 1
+        self.N[action] = n = self.N[action] - 1
+        self.W[action] = w = self.W[action] + loss
+        self.Q[action] = w / n if n else 0.0
+        self.P[action] = self.prior[action] / (1 + n)
+
+
+class TableEntry:
+    ''' Cached model evaluation and shared tree node for a position '''
+    __slots__ = ('probs', 'values', 'node')
+
+    def __init__(self):
+        self.probs = None
+        self.values = None
+        self.node = None
+
+
+class TranspositionTable:
+    '''
+    Bounded table of positions reached during search, keyed by (state,
+    player) and evicting the least recently used.  Caches the model
+    evaluation of each position, and the tree node for it so that all
+    move orders reaching a position share its visit statistics.
+    '''
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # Map from key() -> TableEntry
+        self.hits = 0  # Cached model evaluations used
+        self.misses = 0  # Model evaluations not in the table
+        self.transpositions = 0  # Tree nodes replaced with a shared node
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def key(state, player):
+        if isinstance(state, np.ndarray):  # Mutable and unhashable
+            state = state.tobytes()
+        return state, player
+
+    def entry(self, state, player):
+        ''' Get the entry for a position, adding it if missing '''
+        key = self.key(state, player)
+        entry = self.entries.get(key, None)
+        if entry is None:
+            entry = self.entries[key] = TableEntry()
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        return entry
+
+    def lookup(self, state, player):
+        ''' Cached (probs, values) model evaluation, or None '''
+        entry = self.entry(state, player)
+        if entry.probs is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.probs, entry.values
+
+    def store(self, state, player, probs, values):
+        ''' Cache a model evaluation '''
+        entry = self.entry(state, player)
+        entry.probs, entry.values = probs, values
+
+    def node(self, state, player, tree=None):
+        '''
+        Shared tree node for a position.  If there isn't one yet, tree
+        (if given) becomes the shared node.
+        '''
+        entry = self.entry(state, player)
+        if entry.node is None:
+            entry.node = tree
+        elif tree is not None and entry.node is not tree:
+            self.transpositions += 1
+        return entry.node
+
+    def clear(self):
+        ''' Drop all entries, e.g. when the model changes '''
+        self.entries.clear()
+
+    def stats(self):
+        ''' Size and hit/miss counters '''
+        lookups = max(self.hits + self.misses, 1)
+        return dict(size=len(self.entries), hits=self.hits,
+                    misses=self.misses, hit_rate=self.hits / lookups,
+                    transpositions=self.transpositions)
 
 
 class AlphaZero:
@@ -46,8 +292,22 @@ class AlphaZero:
                  c_puct=1.0,
                  tau=1.0,
                  eps=1e-6,
-                 sims_per_search=1000):
-        ''' Train a model to play a game with the AlphaZero algorithm '''
+                 sims_per_search=1000,
+                 batch_size=1,
+                 virtual_loss=1.0,
+                 reuse_tree=False,
+                 max_reuse_nodes=None,
+                 table=None,
+                 metrics=None):
+        '''
+        Train a model to play a game with the AlphaZero algorithm
+            batch_size - simulations descended per batched model call
+            virtual_loss - temporary loss applied along pending descents
+            reuse_tree - keep the subtree of the chosen move between moves
+            max_reuse_nodes - cap on nodes kept when re-using the subtree
+            table - optional TranspositionTable to share between searches
+            metrics - optional metrics.Metrics to record counters and timers
+        '''
         self.rs = np.random.RandomState(seed)
         self._game = game
         self._model = model
@@ -55,6 +315,12 @@ class AlphaZero:
         self.tau = tau
         self.eps = eps
         self.sims_per_search = sims_per_search
+        self.batch_size = batch_size
+        self.virtual_loss = virtual_loss
+        self.reuse_tree = reuse_tree
+        self.max_reuse_nodes = max_reuse_nodes
+        self.table = table
+        self.metrics = NullMetrics() if metrics is None else metrics
 
     @classmethod
     def make(cls, game_cls, model_cls, seed=None, *args, **kwargs):
@@ -63,14 +329,47 @@ class AlphaZero:
         model = model_cls(game.n_action, game.n_view, game.n_player, seed=seed)
         return cls(game=game, model=model, seed=seed, *args, **kwargs)
 
-    def model(self, state, player):
+    def model(self, state, player, valid=None):
         ''' Wrap the model to give the proper view and mask actions '''
-        valid = self._game.valid(state, player)
-        view = self._game.view(state, player)
+        if self.table is not None:
+            cached = self.table.lookup(state, player)
+            if cached is not None:
+                return cached
+        if valid is None:
+            valid = self._game.valid_unchecked(state, player)
+        self.metrics.lap('select')
+        view = self._game.view_unchecked(state, player)
         logits, value = self._model.model(view)
         probs = softmax(logits, valid)
+        self.metrics.count('model_calls')
+        self.metrics.count('model_positions')
+        self.metrics.lap('model')
+        if self.table is not None:
+            self.table.store(state, player, probs, value)
         return probs, value
 
+    def model_batch(self, states, players):
+        ''' Batched version of model(), one model call for all states '''
+        results = [None] * len(states)
+        if self.table is not None:
+            results = [self.table.lookup(s, p)
+                       for s, p in zip(states, players)]
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            self.metrics.lap('select')
+            views = [self._game.view_unchecked(states[i], players[i])
+                     for i in misses]
+            logits, values = self._model.model_batch(views)
+            for i, x, value in zip(misses, logits, values):
+                valid = self._game.valid_unchecked(states[i], players[i])
+                results[i] = softmax(x, valid), value
+                if self.table is not None:
+                    self.table.store(states[i], players[i], *results[i])
+            self.metrics.count('model_calls')
+            self.metrics.count('model_positions', len(misses))
+            self.metrics.lap('model')
+        return [r[0] for r in results], [r[1] for r in results]
+
     def simulate(self, state, player, tree):
         '''
         Simulate a game by traversing tree
@@ -80,26 +379,147 @@ class AlphaZero:
         returns
             values - player-length list of values
         '''
-        valid = self._game.valid(state, player)
-        action, child = tree.select(valid)
-        if child is None:
-            prior, values = self.model(state, player)
-            tree.leaf(action, prior)
-        else:
-            state, next_player, values = self._game.step(state, player, action)
-            if values is None:
-                values = self.simulate(state, next_player, child)
-        tree.backup(action, values[player])
+        if not tree.materialized:
+            self.materialize(tree, state, player)
+        path = []  # (tree, action, player) from the root down to the leaf
+        while True:
+            action, child = tree.select(tree.valid)
+            path.append((tree, action, tree.player))
+            if child is None:
+                prior, values = self.model(tree.state, tree.player,
+                                           tree.valid)
+                tree.leaf(action, prior)
+                break
+            if not child.materialized:
+                child = self.expand(tree, action, child)
+            if child.outcome is not None:
+                values = child.outcome
+                break
+            tree = child
+        self.metrics.lap('select')
+        for tree, action, player in path:
+            tree.backup(action, values[player])
+        self.metrics.lap('backup')
         return values
 
-    def search(self, state, player, sims_per_search=None):
-        ''' MCTS to generate move probabilities for a state '''
+    def materialize(self, tree, state, player, outcome=None):
+        ''' Cache a position in a tree node, see Tree.materialize() '''
+        valid = None
+        if outcome is None:
+            valid = self._game.valid_unchecked(state, player)
+        tree.materialize(state, player, outcome, valid)
+
+    def expand(self, tree, action, child):
+        '''
+        Step the game from tree through action to materialize child, the
+        first time a simulation passes through it.  Game steps are assumed
+        deterministic.  Returns the child, which may be replaced with a
+        node shared through the transposition table.
+        '''
+        self.metrics.lap('select')
+        state, player, outcome = self._game.step_unchecked(
+            tree.state, tree.player, action)
+        if outcome is None and self.table is not None:
+            # Share nodes between transpositions
+            child = self.table.node(state, player, child)
+            tree.children[action] = child
+        if not child.materialized:
+            self.materialize(child, state, player, outcome)
+        self.metrics.count('game_steps')
+        self.metrics.lap('step')
+        return child
+
+    def descend(self, state, player, tree, loss):
+        '''
+        Walk down the tree applying virtual loss until reaching a leaf
+            state - game state tuple
+            player - current player index
+            tree - MCTS tree rooted at current state
+            loss - virtual loss applied to each selected action
+        returns
+            path - list of (tree, action, player) visited
+            leaf - (state, player) to evaluate, or None if game ended
+            values - player-length list of values if game ended, else None
+        '''
+        if not tree.materialized:
+            self.materialize(tree, state, player)
+        path = []
+        while True:
+            action, child = tree.select(tree.valid)
+            tree.add_loss(action, loss)
+            path.append((tree, action, tree.player))
+            if child is None:
+                return path, (tree.state, tree.player), None
+            if not child.materialized:
+                child = self.expand(tree, action, child)
+            if child.outcome is not None:
+                return path, None, child.outcome
+            tree = child
+
+    def simulate_batch(self, state, player, tree, n_sims):
+        '''
+        Simulate n_sims games with virtual loss, evaluating all the leaves
+        reached with a single batched model call.
+        '''
+        loss = self.virtual_loss
+        pending = []  # (path, index of leaf) for descents awaiting the model
+        leaves = dict()  # Map from (id(tree), action) -> index of leaf
+        states, players, nodes = [], [], []
+        for _ in range(n_sims):
+            path, leaf, values = self.descend(state, player, tree, loss)
+            if leaf is None:  # Game ended, no need to wait for the model
+                self.metrics.lap('select')
+                for node, action, node_player in path:
+                    node.revert_loss(action, loss)
+                    node.backup(action, values[node_player])
+                self.metrics.lap('backup')
+                continue
+            node, action, _ = path[-1]
+            key = (id(node), action)
+            if key not in leaves:
+                leaves[key] = len(nodes)
+                nodes.append((node, action))
+                states.append(leaf[0])
+                players.append(leaf[1])
+            pending.append((path, leaves[key]))
+        if not nodes:
+            return
+        priors, values = self.model_batch(states, players)
+        for (node, action), prior in zip(nodes, priors):
+            node.leaf(action, prior)
+        for path, i in pending:
+            for node, action, node_player in path:
+                node.revert_loss(action, loss)
+                node.backup(action, values[i][node_player])
+        self.metrics.lap('backup')
+
+    def search(self, state, player, sims_per_search=None, tree=None):
+        '''
+        MCTS to generate move probabilities for a state
+            tree - optional tree rooted at state to continue searching,
+                   simulations already in it count towards sims_per_search
+        Returns probabilities and the tree, see Tree.subtree() for re-use
+        '''
         if sims_per_search is None:
             sims_per_search = self.sims_per_search
-        prior, _ = self.model(state, player)
-        tree = Tree(prior, self.c_puct)
-        for i in range(sims_per_search):
-            self.simulate(state, player, tree)
+        self.metrics.mark()
+        if tree is None and self.table is not None:
+            tree = self.table.node(state, player)
+        if tree is None:
+            prior, _ = self.model(state, player)
+            tree = Tree(prior, self.c_puct)
+            self.materialize(tree, state, player)
+            if self.table is not None:
+                self.table.node(state, player, tree)
+        sims_per_search = max(sims_per_search - tree.T, 0)
+        self.metrics.count('simulations', sims_per_search)
+        if self.batch_size > 1:
+            for i in range(0, sims_per_search, self.batch_size):
+                n_sims = min(self.batch_size, sims_per_search - i)
+                self.simulate_batch(state, player, tree, n_sims)
+        else:
+            for i in range(sims_per_search):
+                self.simulate(state, player, tree)
         pi = np.power(tree.N, 1 / self.tau)
         probs = pi / np.sum(pi)
         return probs, tree
@@ -112,42 +532,167 @@ class AlphaZero:
             outcome - final reward for each player
         '''
         trajectory = []
+        tree = None
         state, player, outcome = self._game.start()
         while outcome is None:
-            probs, _ = self.search(state, player)
+            start = time.perf_counter()
+            probs, tree = self.search(state, player, tree=tree)
+            if self.metrics.enabled:
+                self.record_move(tree, time.perf_counter() - start)
             action = sample_probs(probs, rs=self.rs)
             obs = self._game.view(state, player)
             trajectory.append((obs, probs))
             state, player, outcome = self._game.step(state, player, action)
+            tree = self.next_tree(tree, action)
+        self.metrics.count('games')
+        self.metrics.emit('game', moves=len(trajectory), outcome=outcome)
         return trajectory, outcome
 
-    def play_multi(self, n_games=10):
+    def record_move(self, tree, latency):
+        ''' Record per-move latency and search tree statistics '''
+        size, depth = tree.size(), tree.depth()
+        self.metrics.count('moves')
+        self.metrics.observe('move_latency', latency)
+        self.metrics.observe('tree_size', size)
+        self.metrics.observe('tree_depth', depth)
+        self.metrics.emit('move', latency=latency, tree_size=size,
+                          tree_depth=depth, simulations=tree.T)
+
+    def next_tree(self, tree, action):
+        ''' Tree to continue searching from after action, or None '''
+        if not self.reuse_tree:
+            return None
+        return tree.subtree(action, self.max_reuse_nodes)
+
+    def play_multi(self, n_games=10, n_workers=None, server=None):
         '''
         Play multiple whole games, return a list of game results.
         See play() for result of a single game.
+            n_workers - number of processes to play in, see play_parallel()
+            server - optional InferenceServer for the worker processes
         '''
+        if n_workers is not None and n_workers > 1:
+            return list(self.play_parallel(n_games, n_workers, server))
         games = []
         for i in range(n_games):
             print('playing game', i)
             games.append(self.play())
         return games
 
-    def train(self, n_epochs=10, n_games=10):
+    def play_parallel(self, n_games=10, n_workers=None, server=None):
+        '''
+        Play multiple whole games in a pool of worker processes.
+        Yields game results in the order the games were submitted.
+        Each game gets its own seed drawn from self.rs, so results only
+        depend on our seed.  Workers get a copy of self with the model
+        replaced by Model.inference(), or by a client of server if given.
+            server - running InferenceServer with a client for each worker
+        '''
+        seeds = self.rs.randint(2 ** 31, size=n_games).tolist()
+        worker = copy.copy(self)
+        worker.metrics = NullMetrics()  # Not gathered from workers
+        if server is None:
+            worker._model = self._model.inference()
+            initargs = (worker,)
+        else:
+            n_workers = n_workers or multiprocessing.cpu_count()
+            assert len(server.clients) >= n_workers, 'Need client per worker'
+            worker._model = None
+            initargs = (worker, server.clients, multiprocessing.Value('i'))
+        with multiprocessing.Pool(n_workers, initializer=_init_worker,
+                                  initargs=initargs) as pool:
+            yield from pool.imap(_play_worker, seeds)
+
+    def seed(self, seed):
+        ''' Re-seed our random state and the game's '''
+        self.rs = np.random.RandomState(seed)
+        self._game.random.seed(seed)
+
+    def train(self, n_epochs=10, n_games=10, n_workers=None, server=None):
         '''
         Train the model for a number of epochs of multi-play
+            n_workers - number of processes to play in, see play_multi()
+            server - optional InferenceServer for the worker processes
         '''
         for i in range(n_epochs):
-            games = self.play_multi(n_games=n_games)
+            games = self.play_multi(n_games, n_workers, server)
             loss = self._model.update(games)
             print('epoch', i, 'loss', loss)
+            self.metrics.emit('update', epoch=i, loss=loss)
+            if self.table is not None:  # Cached evaluations are stale
+                self.table.clear()
+
+    def train_pipelined(self, n_updates=10, n_games=10, n_workers=None,
+                        max_pending=None, max_staleness=1):
+        '''
+        Train with self-play in worker processes overlapping model updates.
+        Workers keep playing queued games while the model updates, and
+        each update publishes a new Model.inference() snapshot for the
+        games queued after it.  Snapshots are written to a file once per
+        version, and each worker loads a version the first time it plays
+        a game with it.
+            n_updates - number of model updates to run
+            n_games - fresh games per update
+            n_workers - number of self-play processes
+            max_pending - most games queued or playing, default 2 per worker
+            max_staleness - drop games played by a snapshot older than this
+                            many updates
+        Returns dict of counts, games/s and updates/s
+        '''
+        n_workers = n_workers or multiprocessing.cpu_count()
+        max_pending = max_pending or 2 * n_workers
+        worker = copy.copy(self)
+        worker._model = None  # Loaded from snapshots, see _play_snapshot()
+        worker.metrics = NullMetrics()  # Not gathered from workers
+        pending = deque()  # AsyncResult for each game in submission order
+        n_played = n_stale = 0
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as tmp, \
+                multiprocessing.Pool(n_workers, initializer=_init_worker,
+                                     initargs=(worker,)) as pool:
+            version, path = self.publish(tmp)
+            for i in range(n_updates):
+                games = []
+                while len(games) < n_games:
+                    while len(pending) < max_pending:
+                        task = (self.rs.randint(2 ** 31), version, path)
+                        pending.append(pool.apply_async(_play_snapshot,
+                                                        (task,)))
+                    played, game = pending.popleft().get()
+                    n_played += 1
+                    if version - played > max_staleness:
+                        n_stale += 1
+                    else:
+                        games.append(game)
+                loss = self._model.update(games)
+                print('update', i, 'loss', loss)
+                self.metrics.emit('update', epoch=i, loss=loss)
+                if self.table is not None:  # Cached evaluations are stale
+                    self.table.clear()
+                version, path = self.publish(tmp)
+            pool.terminate()  # Drop games queued past the last update
+        elapsed = time.perf_counter() - start
+        return dict(games=n_played, stale_games=n_stale, updates=n_updates,
+                    games_per_sec=n_played / elapsed,
+                    updates_per_sec=n_updates / elapsed)
+
+    def publish(self, directory):
+        ''' Save a snapshot of the model, returns its version and path '''
+        version = self._model.n_updates
+        path = os.path.join(directory, 'model%d.pkl' % version)
+        with open(path, 'wb') as f:
+            pickle.dump(self._model.inference(), f)
+        return version, path
 
     def rollout(self):
         ''' Rollout a game against self and return final state '''
+        tree = None
         state, player, outcome = self._game.start()
         while outcome is None:
-            probs, _ = self.search(state, player)
+            probs, tree = self.search(state, player, tree=tree)
             action = sample_probs(probs, rs=self.rs)
             state, player, outcome = self._game.step(state, player, action)
+            tree = self.next_tree(tree, action)
         return state
 
     def print_rollout(self):
@@ -155,6 +700,37 @@ class AlphaZero:
         print(self._game.human(self.rollout()))
 
 
+_worker = None  # AlphaZero instance in each play_parallel() worker process
+_version = None  # Model version of the worker, see _play_snapshot()
+
+
+def _init_worker(azero, clients=None, counter=None):
+    global _worker
+    _worker = azero
+    if clients is not None:  # Take the next unused InferenceServer client
+        with counter.get_lock():
+            azero._model = clients[counter.value]
+            counter.value += 1
+
+
+def _play_worker(seed):
+    _worker.seed(seed)
+    if _worker.table is not None:  # Games only depend on their own seed
+        _worker.table.clear()
+    return _worker.play()
+
+
+def _play_snapshot(task):
+    ''' Play a game with a model snapshot, see train_pipelined() '''
+    global _version
+    seed, version, path = task
+    if version != _version:  # Load each snapshot once per worker
+        with open(path, 'rb') as f:
+            _worker._model = pickle.load(f)
+        _version = version
+    return version, _play_worker(seed)
+
+
 if __name__ == '__main__':
     from game import MNOP  # noqa
     from model import MLP  # noqa
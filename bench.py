@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import time
+import random
+import timeit
+import argparse
+import subprocess
+import numpy as np
+import nn
+from game import Connect3, BitConnect3, MNOP, BitMNOP, Nim
+from model import Uniform, Linear, Memorize, FrozenMLP, NumpyMLP, MLP
+from azero import AlphaZero, Tree
+
+GAMES = [('MNOP 3x3', MNOP()),
+         ('MNOP 7x7', MNOP(7, 7, 4)),
+         ('MNOP 15x15', MNOP(15, 15, 5)),
+         ('BitMNOP 3x3', BitMNOP()),
+         ('BitMNOP 7x7', BitMNOP(7, 7, 4)),
+         ('BitMNOP 15x15', BitMNOP(15, 15, 5)),
+         ('Connect3', Connect3()),
+         ('BitConnect3', BitConnect3()),
+         ('Nim', Nim()),
+         ('Nim 10-70', Nim((10, 30, 50, 70)))]
+
+# Games to search, by name in GAMES.  Connect3 steps modify the state in
+# place, so search uses the immutable BitConnect3.
+SEARCH_GAMES = ['MNOP 3x3', 'MNOP 7x7', 'MNOP 15x15', 'BitConnect3', 'Nim']
+
+MODELS = [Uniform, Linear, Memorize, FrozenMLP, NumpyMLP, MLP]
+
+
+def best_time(fn, number=1000, repeat=3):
+    ''' Best seconds per call of fn over repeat runs of number calls '''
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def report(results, name, seconds, unit='call'):
+    ''' Print and record a result, in seconds per unit '''
+    results[name] = seconds
+    print('{:32} {:10.2f}us/{}'.format(name, seconds * 1e6, unit))
+
+
+def random_games(game, n_games=100, checked=True, seed=0):
+    '''
+    Play random games calling valid(), view() and step() every turn.
+        checked - use the checked methods, else the unchecked ones
+    Returns seconds per turn.
+    '''
+    if checked:
+        step, valid, view = game.step, game.valid, game.view
+    else:
+        step = game.step_unchecked
+        valid = game.valid_unchecked
+        view = game.view_unchecked
+    rs = random.Random(seed)
+    n_steps = 0
+    start = time.perf_counter()
+    for _ in range(n_games):
+        state, player, outcome = game.start()
+        while outcome is None:
+            view(state, player)
+            actions = [i for i, v in enumerate(valid(state, player)) if v]
+            state, player, outcome = step(state, player, rs.choice(actions))
+            n_steps += 1
+    return (time.perf_counter() - start) / n_steps
+
+
+def bench_games(n_games=100):
+    ''' Compare checked and unchecked game methods '''
+    results = dict()
+    for name, game in GAMES:
+        checked = random_games(game, n_games, checked=True)
+        unchecked = random_games(game, n_games, checked=False)
+        print('{:14} checked {:7.2f}us unchecked {:7.2f}us saved {:5.1f}%'
+              .format(name, checked * 1e6, unchecked * 1e6,
+                      100 * (1 - unchecked / checked)))
+        results['game/{}/checked'.format(name)] = checked
+        results['game/{}/unchecked'.format(name)] = unchecked
+    return results
+
+
+def bench_startup(modules=('game', 'model', 'azero', 'server'), n=5):
+    ''' Time importing modules in a fresh interpreter, best of n runs '''
+    code = 'import sys, {}; print("tensorflow" in sys.modules)'.format(
+        ', '.join(modules))
+    best = float('inf')
+    for _ in range(n):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             stdout=subprocess.PIPE, universal_newlines=True)
+        best = min(best, time.perf_counter() - start)
+    print('startup {:7.1f}ms tensorflow loaded: {}'.format(
+        best * 1e3, out.stdout.strip()))
+    return dict(startup=best)
+
+
+def bench_tree(cases=((9, None), (225, None), (225, 10)), n_visits=100):
+    '''
+    Tree.select() and Tree.backup() on a node with some visits
+        cases - (actions, valid actions) pairs, None for about 80% valid
+    '''
+    results = dict()
+    rs = np.random.RandomState(0)
+    for n, n_valid in cases:
+        tree = Tree(rs.dirichlet(np.ones(n)), c_puct=1.0)
+        if n_valid is None:
+            valid = rs.rand(n) < 0.8
+            valid[0] = True
+            name = str(n)
+        else:  # Late in a game on a wide board
+            valid = np.zeros(n, dtype=bool)
+            valid[rs.choice(n, n_valid, replace=False)] = True
+            name = '{}/{}valid'.format(n, n_valid)
+        for _ in range(n_visits):
+            action, _ = tree.select(valid)
+            tree.backup(action, rs.randn())
+        report(results, 'tree/select/{}'.format(name),
+               best_time(lambda: tree.select(valid)))
+        report(results, 'tree/select_dense/{}'.format(name),
+               best_time(lambda: tree.select_dense(valid)))
+        report(results, 'tree/backup/{}'.format(name),
+               best_time(lambda: tree.backup(0, 0.5)))
+    return results
+
+
+def bench_search(n_sims=500):
+    ''' AlphaZero.search() from the start of each game, per simulation '''
+    results = dict()
+    games = dict(GAMES)
+    for name in SEARCH_GAMES:
+        game = games[name]
+        model = Linear(game.n_action, game.n_view, game.n_player, seed=0)
+        azero = AlphaZero(game, model, seed=0, sims_per_search=n_sims)
+        state, player, _ = game.start()
+        seconds = best_time(lambda: azero.search(state, player), number=1)
+        report(results, 'search/{}'.format(name), seconds / n_sims, 'sim')
+    return results
+
+
+def bench_models(batch_size=32):
+    ''' Model.model() and Model.model_batch() latency on MNOP 7x7 '''
+    results = dict()
+    game = MNOP(7, 7, 4)
+    obs = np.random.RandomState(0).rand(batch_size, game.n_view)
+    for cls in MODELS:
+        try:
+            model = cls(game.n_action, game.n_view, game.n_player, seed=0)
+        except ImportError:  # MLP without tensorflow installed
+            print('{:32} skipped, import failed'.format(cls.__name__))
+            continue
+        report(results, 'model/{}'.format(cls.__name__),
+               best_time(lambda: model.model(obs[0])))
+        report(results, 'model_batch/{}'.format(cls.__name__),
+               best_time(lambda: model.model_batch(obs), number=100) /
+               batch_size, 'position')
+    return results
+
+
+def bench_nn(batch_size=32, n_in=98, n_out=64):
+    ''' Forward and backward kernels in nn.py '''
+    results = dict()
+    rs = np.random.RandomState(0)
+    x = rs.randn(batch_size, n_in)
+    W = rs.randn(n_in, n_out)
+    b = rs.randn(n_out)
+    out, mlp_cache = nn.mlp_fwd(x, W, b)
+    _, relu_cache = nn.relu_fwd(out)
+    q = rs.dirichlet(np.ones(n_out - 2), size=batch_size)
+    z = rs.randn(batch_size, 2)
+    loss, loss_cache = nn.loss_fwd(out, q, z, 0.5)
+    dW = rs.randn(n_in, n_out)
+    m, v = np.zeros_like(W), np.zeros_like(W)
+    kernels = [('mlp_fwd', lambda: nn.mlp_fwd(x, W, b)),
+               ('mlp_bak', lambda: nn.mlp_bak(out, mlp_cache)),
+               ('relu_fwd', lambda: nn.relu_fwd(out)),
+               ('relu_bak', lambda: nn.relu_bak(out, relu_cache)),
+               ('loss_fwd', lambda: nn.loss_fwd(out, q, z, 0.5)),
+               ('loss_bak', lambda: nn.loss_bak(loss, loss_cache)),
+               ('adam', lambda: nn.adam(W.copy(), dW, m, v, 1))]
+    for name, fn in kernels:
+        report(results, 'nn/{}'.format(name), best_time(fn))
+    return results
+
+
+def bench_play(n_games=3, n_sims=100):
+    ''' AlphaZero.play() end to end, per position played '''
+    results = dict()
+    for name in ('MNOP 3x3', 'BitConnect3'):
+        game = dict(GAMES)[name]
+        model = Linear(game.n_action, game.n_view, game.n_player, seed=0)
+        azero = AlphaZero(game, model, seed=0, sims_per_search=n_sims)
+        start = time.perf_counter()
+        n_positions = sum(len(azero.play()[0]) for _ in range(n_games))
+        seconds = (time.perf_counter() - start) / n_positions
+        report(results, 'play/{}'.format(name), seconds, 'position')
+        print('{:32} {:10.1f} positions/s'.format('', 1 / seconds))
+    return results
+
+
+BENCHMARKS = dict(startup=bench_startup, games=bench_games, tree=bench_tree,
+                  search=bench_search, models=bench_models, nn=bench_nn,
+                  play=bench_play)
+
+
+def run(names=None, n_games=100):
+    ''' Run the named benchmarks (default all), returns merged results '''
+    results = dict()
+    for name in names or BENCHMARKS:
+        print('#', name)
+        if name == 'games':
+            results.update(bench_games(n_games))
+        else:
+            results.update(BENCHMARKS[name]())
+    return results
+
+
+def compare(baseline, results, threshold=0.1):
+    '''
+    Compare results to a baseline, both dicts of seconds per operation.
+    Prints each shared benchmark, returns names slower by over threshold.
+    '''
+    regressions = []
+    for name in sorted(set(baseline) & set(results)):
+        change = results[name] / baseline[name] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = 'REGRESSION'
+        print('{:32} {:10.2f}us {:10.2f}us {:+7.1f}% {}'.format(
+            name, baseline[name] * 1e6, results[name] * 1e6, 100 * change,
+            flag))
+    return regressions
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run benchmarks, or compare saved results')
+    parser.add_argument('names', nargs='*',
+                        help='Benchmarks to run, default all of: ' +
+                        ' '.join(BENCHMARKS))
+    parser.add_argument('--n-games', type=int, default=100,
+                        help='Number of games to play per game benchmark')
+    parser.add_argument('--save', help='Save results as a JSON baseline')
+    parser.add_argument('--baseline', help='JSON baseline to compare to')
+    parser.add_argument('--compare', metavar='RESULTS',
+                        help='Compare saved JSON results to --baseline '
+                             'instead of running benchmarks')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Fractional slowdown flagged as a regression')
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error('Unknown benchmarks: ' + ' '.join(sorted(unknown)))
+    if args.compare is not None:
+        if args.baseline is None:
+            parser.error('--compare needs --baseline')
+        results = load(args.compare)
+    else:
+        results = run(args.names, args.n_games)
+        if args.save is not None:
+            with open(args.save, 'w') as f:
+                json.dump(results, f, indent=1, sort_keys=True)
+    if args.baseline is not None:
+        regressions = compare(load(args.baseline), results, args.threshold)
+        if regressions:
+            print('{} regressions beyond {:.0%}'.format(
+                len(regressions), args.threshold))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,8 @@
 
 import random
 import numpy as np
-from itertools import zip_longest
+from itertools import product, zip_longest
+from operator import or_
 ''' for Nim  '''
 from functools import reduce
 
@@ -109,6 +110,22 @@ class Game:
         ''' Print out a human-readable state '''
         return str(state)
 
+    # Unchecked versions of step(), valid() and view() for the inner loop of
+    # search.  They skip validation and don't convert the results to arrays,
+    # so only use them on states that came from the checked methods.
+
+    def step_unchecked(self, state, player, action):
+        ''' Same as step() without validation, outcome is not an array '''
+        return self._step(state, player, action)
+
+    def valid_unchecked(self, state, player):
+        ''' Same as valid() without validation '''
+        return self._valid(state, player)
+
+    def view_unchecked(self, state, player):
+        ''' Same as view() without validation, view is not an array '''
+        return self._view(state, player)
+
 
 
 class Null(Game):
@@ -350,57 +367,116 @@ class Connect3(Game):
         return '\n'.join(buffer)
 
 
+class BitConnect3(Connect3):
+    ''' Connect3 with an immutable state of one bitboard per player.
+        Cell (column, row) is bit 4 * column + row.
+        Unlike Connect3 the view is the board, current player first. '''
+    n_state = 2
+    n_view = 40
+    # Height of a column from its 4 occupied bits, which fill from the bottom
+    heights = {(1 << h) - 1: h for h in range(5)}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Masks of every line of 3 through each cell
+        self.lines = [[] for _ in range(20)]
+        for x, y, (dx, dy) in product(range(5), range(4),
+                                      ((1, 0), (0, 1), (1, 1), (1, -1))):
+            cells = [(x + dx * k, y + dy * k) for k in range(3)]
+            if all(0 <= a < 5 and 0 <= b < 4 for a, b in cells):
+                line = sum(1 << (4 * a + b) for a, b in cells)
+                for a, b in cells:
+                    self.lines[4 * a + b].append(line)
+
+    def _start(self):
+        return (0, 0), 0, None
+
+    def _step(self, state, player, action):
+        action = int(action)  # Keep the boards plain python integers
+        taken = state[0] | state[1]
+        height = self.heights[taken >> 4 * action & 15]
+        assert height < 4
+        cell = 4 * action + height
+        board = state[player] | 1 << cell
+        state = (board, state[1]) if player == 0 else (state[0], board)
+        if any(board & line == line for line in self.lines[cell]):
+            return state, None, [(1, -1), (-1, 1)][player]
+        if taken | 1 << cell == (1 << 20) - 1:
+            return state, None, (0, 0)
+        return state, 1 - player, None
+
+    def _valid(self, state, player):
+        taken = state[0] | state[1]
+        return tuple(not taken >> (4 * i + 3) & 1 for i in range(5))
+
+    def _view(self, state, player):
+        boards = (state[player], state[1 - player])
+        data = b''.join(b.to_bytes(3, 'little') for b in boards)
+        bits = np.frombuffer(data, dtype=np.uint8).reshape(2, 3)
+        bits = np.unpackbits(bits, axis=1, bitorder='little')[:, :20]
+        return bits.reshape(2, 5, 4)
+
+    def _check(self, state, player):
+        b0, b1 = state
+        assert not b0 & b1
+        assert player == (bin(b0).count('1') - bin(b1).count('1'))
+
+    def human(self, state):
+        grid = -np.ones((5, 4), dtype=np.int8)
+        for p, board in enumerate(state):
+            for k in range(20):
+                if board >> k & 1:
+                    grid[divmod(k, 4)] = p
+        return super().human(grid)
+
+
 class Nim(Game):
-    ''' Nim, see https://en.wikipedia.org/wiki/Nim '''
-    
-    def __init__(self, s=(3,5,7), p=2, *args, **kwargs):
+    ''' Nim, see https://en.wikipedia.org/wiki/Nim
+        State is the number of stones in each pile, then the next player.
+        Action pile * mp + j leaves j stones in that pile. '''
+
+    def __init__(self, s=(3, 5, 7), p=2, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.ps = len(s)  # number of piles
-        self.mp = max(s) # largest pile
+        self.mp = max(s)  # largest pile
         self.n_player = self.p = p
-        self.n_action = self.ps * self.mp 
-        self.n_state = self.n_view = self.ps * self.mp + 1
-        self.st = (0,) * self.n_state 
-        for i in range(self.ps):
-            for j in range(s[i]):
-                k = i * self.mp + j
-                self.st = self.st[:k] + (1,) + self.st[k+1:]
+        self.n_action = self.ps * self.mp
+        self.n_state = self.ps + 1
+        self.n_view = self.ps * self.mp + 1  # stones in unary, then player
+        self.s = tuple(s)
+        # Unary expansion of each pile size, as array rows and as tuples
+        self.unary = np.arange(self.mp) < np.arange(self.mp + 1)[:, None]
+        self.masks = [tuple(row.tolist()) for row in self.unary]
 
     def _start(self):
-        return self.st, 0, None
+        return self.s + (0,), 0, None
 
     def _step(self, state, player, action):
-        assert state[action] == 1
-        assert action < len(state) -1 # didn't play action = player variable
-        cap = (int(action / self.mp) + 1) * self.mp # beginning index of the next pile
-        # remove all the stones until the next pile
-        i = action 
-        while i < cap:
-            state = state[:i] + (0,) + state[i + 1:]
-            i += 1
-        if self._win(state, player, action):
+        pile, j = divmod(int(action), self.mp)
+        assert j < state[pile]
+        state = state[:pile] + (j,) + state[pile + 1:-1]
+        if not any(state):
             outcome = [-1] * self.n_player
             outcome[player] = self.n_player - 1
             return None, None, tuple(outcome)
         nextplayer = (player + 1) % self.n_player
-        return (state[:len(state)-1] + (nextplayer,)), nextplayer, None
-
-    def _win(self, state, player, action):
-        assert state[action] == 0 # Post state update
-        if state[:len(state)-1].count(1) == 0:
-            return True
+        return state + (nextplayer,), nextplayer, None
 
     def _valid(self, state, player):
-#        if state[len(state)-1] != player:
-#            return tuple(False for s in state)
-        return tuple(s == 1 for s in state[:len(state)-1]) # + (False,)
+        return sum((self.masks[n] for n in state[:-1]), ())
+
+    def _view(self, state, player):
+        view = np.empty(self.n_view)
+        view[:-1] = self.unary[list(state[:-1])].ravel()
+        view[-1] = state[-1]
+        return view
 
     def _check(self, state, player):
-        assert state[len(state)-1] == player
+        assert state[-1] == player
+        assert all(0 <= n <= s for n, s in zip(state, self.s))
 
     def human(self, state):
-        st = state[:len(state)-1]
-        board = tuple(zip_longest(*([iter(st)] * self.mp)))
+        board = self.unary[list(state[:-1])].astype(int)
         return '\n'.join(' '.join('%+2d' % s for s in row) for row in board)
 
 
@@ -473,8 +549,83 @@ class MNOP(Game):
         return '\n'.join(' '.join(row) for row in board)
 
 
+class BitMNOP(MNOP):
+    ''' Generalized tic-tac-toe, with a bitboard per player as state '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        m, n, o = self.m, self.n, self.o
+        self.n_state = self.n_player  # One board per player, see _check()
+        # Cell k = i * m + j is bit k, for row i < n and column j < m
+        self.full = (1 << (m * n)) - 1
+        self.n_bytes = (m * n + 7) // 8
+        # Masks of every winning line through each cell
+        self.lines = [[] for _ in range(m * n)]
+        for i, j, (di, dj) in product(range(n), range(m),
+                                      ((0, 1), (1, 0), (1, 1), (1, -1))):
+            cells = [(i + di * k, j + dj * k) for k in range(o)]
+            if all(0 <= a < n and 0 <= b < m for a, b in cells):
+                line = sum(1 << (a * m + b) for a, b in cells)
+                for a, b in cells:
+                    self.lines[a * m + b].append(line)
+
+    def unpack(self, boards):
+        ''' Unpack a sequence of bitboards into a (len, m * n) array '''
+        data = b''.join(b.to_bytes(self.n_bytes, 'little') for b in boards)
+        bits = np.frombuffer(data, dtype=np.uint8).reshape(len(boards), -1)
+        bits = np.unpackbits(bits, axis=1, bitorder='little')
+        return bits[:, :self.n_action]
+
+    def _start(self):
+        return (0,) * self.n_player, 0, None
+
+    def _step(self, state, player, action):
+        action = int(action)  # Numpy integers would overflow on big boards
+        bit = 1 << action
+        taken = reduce(or_, state)
+        assert not taken & bit
+        board = state[player] | bit
+        state = state[:player] + (board,) + state[player + 1:]
+        if self._win(state, player, action):
+            outcome = -np.ones(self.n_player)
+            outcome[player] = self.n_player - 1
+            return state, None, outcome
+        if taken | bit == self.full:
+            return state, None, (0,) * self.n_player
+        return state, (player + 1) % self.n_player, None
+
+    def _win(self, state, player, action):
+        board = state[player]
+        assert board >> action & 1  # Post state update
+        return any(board & line == line for line in self.lines[action])
+
+    def _valid(self, state, player):
+        free = self.full & ~reduce(or_, state)
+        return tuple(self.unpack((free,))[0].astype(bool).tolist())
+
+    def _view(self, state, player):
+        p = self.n_player
+        boards = [state[(player + i) % p] for i in range(p)]
+        return self.unpack(boards).reshape(p, self.n, self.m)
+
+    def _check(self, state, player):
+        assert len(state) == self.n_player
+        counts = [bin(b).count('1') for b in state]
+        assert sum(counts) == bin(reduce(or_, state)).count('1')
+        assert player == sum(counts) % self.n_player
+
+    def human(self, state):
+        cells = ['-'] * self.n_action
+        for p, board in enumerate(state):
+            for k in range(self.n_action):
+                if board >> k & 1:
+                    cells[k] = str(p)
+        board = tuple(zip_longest(*([iter(cells)] * self.m)))
+        return '\n'.join(' '.join(row) for row in board)
+
+
 games = [Null, Binary, Flip, Count, Narrow,
-         Matching, Roshambo, Modulo, MNOP]
+         Matching, Roshambo, Modulo, MNOP, BitMNOP, BitConnect3, Nim]
 
 if __name__ == '__main__':
     from play import main  # noqa
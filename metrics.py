@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import json
+import time
+from collections import Counter
+
+
+class Metrics:
+    '''
+    Counters and phase timers for search and self-play, see AlphaZero.
+    Time is split into phases with lap(), so the phases of a search add up
+    to its wall time without nesting timers.
+    '''
+    enabled = True
+
+    def __init__(self, stream=None):
+        '''
+            stream - optional path or file to write events to as JSON lines
+        '''
+        if isinstance(stream, str):
+            stream = open(stream, 'a')
+        self.stream = stream
+        self.reset()
+
+    def reset(self):
+        ''' Zero all counters and timers '''
+        self.counts = Counter()
+        self.times = Counter()  # Seconds spent in each phase
+        self.observed = dict()  # Map from name -> [count, total, maximum]
+        self.last = time.perf_counter()
+
+    def count(self, name, n=1):
+        ''' Add n to counter name '''
+        self.counts[name] += n
+
+    def mark(self):
+        ''' Start timing, without charging the time since the last lap '''
+        self.last = time.perf_counter()
+
+    def lap(self, name):
+        ''' Charge the time since the last lap (or mark) to phase name '''
+        now = time.perf_counter()
+        self.times[name] += now - self.last
+        self.last = now
+
+    def observe(self, name, value):
+        ''' Record a sample of a measurement, e.g. tree size '''
+        stat = self.observed.get(name, None)
+        if stat is None:
+            self.observed[name] = [1, value, value]
+        else:
+            stat[0] += 1
+            stat[1] += value
+            stat[2] = max(stat[2], value)
+
+    def emit(self, event, **fields):
+        ''' Write an event to the stream, if there is one '''
+        if self.stream is not None:
+            fields.update(event=event, time=time.time())
+            # numpy scalars and arrays are written as floats and lists
+            self.stream.write(json.dumps(fields, default=_jsonable) + '\n')
+            self.stream.flush()
+
+    def stats(self):
+        ''' Dict of counters, seconds per phase and mean/max measurements '''
+        stats = dict(self.counts)
+        for name, seconds in self.times.items():
+            stats[name + '_time'] = seconds
+        for name, (n, total, maximum) in self.observed.items():
+            stats[name + '_mean'] = total / n
+            stats[name + '_max'] = maximum
+        return stats
+
+
+class NullMetrics(Metrics):
+    ''' Metrics that records nothing, the default for AlphaZero '''
+    enabled = False
+
+    def __init__(self):
+        self.stream = None
+        self.reset()
+
+    def count(self, name, n=1):
+        pass
+
+    def mark(self):
+        pass
+
+    def lap(self, name):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+    def emit(self, event, **fields):
+        pass
+
+
+def _jsonable(x):
+    return x.tolist() if hasattr(x, 'tolist') else float(x)
@@ -1,22 +1,46 @@
 #!/usr/bin/env python
 
 import os
+import time
 import numpy as np
-import tensorflow as tf
+from collections import OrderedDict
 
 from game import Game
-from util import sample_games
+from nn import adam, batchnorm_fold, loss_bak, loss_fwd, mlp_bak, mlp_fwd, \
+    relu_bak, relu_fwd
+from replay import ReplayBuffer
+from util import game_arrays, prefetch
+
+tf = None  # Imported when the first MLP is built, see import_tensorflow()
+
+
+def import_tensorflow():
+    ''' Import tensorflow on first use, it is slow to load '''
+    global tf
+    if tf is None:
+        import tensorflow
+        tf = tensorflow
+    return tf
 
 
 class Model:
     ''' Interface class for a model to be optimized by alphazero algorithm '''
+    c = 0.5  # Linear combination of loss terms, see nn.loss_fwd()
 
-    def __init__(self, n_action, n_view, n_player, seed=None):
+    def __init__(self, n_action, n_view, n_player, seed=None,
+                 buffer_size=10000):
+        '''
+        Model for a game with the given sizes
+            buffer_size - capacity of the replay buffer to train from,
+                          allocated by the first update()
+        '''
         self.rs = np.random.RandomState(seed=seed)
         self.n_act = n_action
         self.n_obs = n_view
         self.n_val = n_player
         self.n_updates = 0
+        self.buffer_size = buffer_size
+        self.buffer = None  # Inference-only models never allocate one
 
     @classmethod
     def make(cls, game):
@@ -34,31 +58,72 @@ class Model:
         '''
         obs = np.asarray(obs, dtype=float)
         assert obs.size == self.n_obs
-        logits, values = self._model(obs)
+        logits, values = self.model_batch(obs.reshape(1, self.n_obs))
+        return logits[0], values[0]
+
+    def model_batch(self, obs):
+        '''
+        Call the model on a batch of board states
+            obs - sequence of observations, see model()
+        Returns
+            logits - array of logits, one row per observation
+            values - array of values, one row per observation
+        '''
+        obs = np.asarray(obs, dtype=float)
+        assert obs.size == len(obs) * self.n_obs
+        obs = obs.reshape(len(obs), self.n_obs)
+        logits, values = self._model_batch(obs)
         logits = np.asarray(logits, dtype=float)
         values = np.asarray(values, dtype=float)
-        assert logits.size == self.n_act
-        assert values.size == self.n_val
+        assert logits.shape == (len(obs), self.n_act)
+        assert values.shape == (len(obs), self.n_val)
+        return logits, values
+
+    def _model_batch(self, obs):
+        # Optionally overwrite this to evaluate the whole batch at once
+        # Default is to call _model() on each (flattened) observation.
+        results = [self._model(o) for o in obs]
+        logits = np.reshape([x for x, _ in results], (len(obs), self.n_act))
+        values = np.reshape([v for _, v in results], (len(obs), self.n_val))
         return logits, values
 
     def _model(self, obs):
         raise NotImplementedError('Implement in subclass')
 
+    def _loss(self, obs, q, z):
+        ''' Evaluate loss on a batch, returns mean and per-sample loss '''
+        logits, values = self.model_batch(obs)
+        loss, _ = loss_fwd(np.c_[logits, values], np.asarray(q),
+                           np.asarray(z), self.c)
+        return np.mean(loss), loss
+
+    def inference(self):
+        '''
+        Return a picklable model for inference in other processes, with
+        the current weights.  Default is to return self.
+        '''
+        return self
+
     def update(self, games):
         '''
         Update model given a list of games.  Each game is a pair of:
             trajectory - list of (obs, probs)
             outcome - total reward per player
+        The games are added to the replay buffer before updating.
         Returns loss (may be evaluated over a subset of game states)
         '''
         self.n_updates += 1
+        if self.buffer is None:
+            self.buffer = ReplayBuffer(self.n_obs, self.n_act, self.n_val,
+                                       self.buffer_size)
+        self.buffer.add_games(games)
         return self._update(games)
 
     def _update(self, games):
         # Optionally overwrite this to get dense updates
-        # Default is to sample single data point from each game
-        # and pass them to _sparse_update().
-        obs, q, z = sample_games(games)
+        # Default is to sample as many positions as there are games from
+        # the replay buffer and pass them to _sparse_update().
+        obs, q, z = self.buffer.sample(len(games), rs=self.rs)
         return self._sparse_update(obs, q, z)
 
     def _sparse_update(self, obs, q, z):
@@ -68,12 +133,12 @@ class Model:
 class Uniform(Model):
     ''' Maximum entropy (uniform distribution) '''
 
-    def _model(self, obs):
+    def _model_batch(self, obs):
         # Fun little hack, sum the observation, then multiply by zero
         # This allows NaN propagation, which is a great way of testing models
-        zero = obs.sum() * 0.0
-        logits = np.ones(self.n_act) * zero
-        values = np.ones(self.n_val) * zero
+        zero = obs.sum(axis=1, keepdims=True) * 0.0
+        logits = np.ones((len(obs), self.n_act)) * zero
+        values = np.ones((len(obs), self.n_val)) * zero
         return logits, values
 
 
@@ -85,8 +150,7 @@ class Linear(Model):
         self.W = self.rs.randn(self.n_obs, self.n_act) * scale
         self.V = self.rs.randn(self.n_obs, self.n_val) * scale
 
-    def _model(self, obs):
-        obs = obs.flatten()
+    def _model_batch(self, obs):
         logits = obs.dot(self.W)
         values = obs.dot(self.V)
         return logits, values
@@ -99,13 +163,17 @@ class Memorize(Model):
         super().__init__(*args, **kwargs)
         self.data = {}  # Map from tuple(state) -> (logits, outcome)
 
-    def _model(self, obs):
+    def _model_batch(self, obs):
         ''' Return data if present, else uniform prior '''
         # Hack to ensure NaN propagation
-        zero = np.sum(obs) * 0.0
-        logits = np.ones(self.n_act) * zero
-        values = np.ones(self.n_val) * zero
-        return self.data.get(obs.tostring(), (logits, values))
+        zero = obs.sum(axis=1, keepdims=True) * 0.0
+        logits = np.ones((len(obs), self.n_act)) * zero
+        values = np.ones((len(obs), self.n_val)) * zero
+        for i, o in enumerate(obs):
+            key = o.tostring()
+            if key in self.data:
+                logits[i], values[i] = self.data[key]
+        return logits, values
 
 
 class MLP(Model):
@@ -113,10 +181,13 @@ class MLP(Model):
                  hidden_units=[10, 10],
                  drop_rate=0.1,
                  batchnorm=True,
-                 activation=tf.nn.relu,
+                 activation='relu',
                  learning_rate=0.001,
                  combination=0.5,
                  step_update=1,
+                 dense=False,
+                 batch_size=32,
+                 n_epochs=1,
                  step_trace=10,
                  step_save=10,
                  step_summary=1,
@@ -128,10 +199,13 @@ class MLP(Model):
             hidden_units - list of sizes of hidden layers
             drop_rate - dropout rate (set to 0.0 to disable)
             batchnorm - boolean to enable batchnorm
-            activation - which tensorflow activation function to use
+            activation - name of a tf.nn activation function, or None
             learning_rate - optimization step size
             combination - linear combination of loss terms
             step_update - how many steps of optimization per batch
+            dense - train on every position of the games, not a sample
+            batch_size - minibatch size for dense updates
+            n_epochs - passes over the positions for dense updates
             step_trace - how many steps between full traces
             step_save - how many steps between saving model
             step_summary - how many steps between writing summary
@@ -141,8 +215,14 @@ class MLP(Model):
             obs - observation input placeholder
             act - action output tensor
         '''
+        import_tensorflow()
         super().__init__(*args, **kwargs)
+        self.c = combination
         self.step_update = step_update
+        self.dense = dense
+        self.batch_size = batch_size
+        self.n_epochs = n_epochs
+        self.samples_per_sec = 0.0  # Throughput of the last update
         self.step_trace = step_trace
         self.step_save = step_save
         self.step_summary = step_summary
@@ -161,23 +241,39 @@ class MLP(Model):
         self.obs = tf.placeholder(tf.float32, [None, self.n_obs], name='obs')
         tf.add_to_collection('obs', self.obs)
         net = tf.identity(self.obs)
+        # Weight tensors by export name, see export()
+        if isinstance(activation, str):
+            activation = getattr(tf.nn, activation)
+        self.activation = activation
+        self.weights = dict()
+        self.epsilon = dict()
         # hidden layers
         for i, units in enumerate(hidden_units):
             # TODO: experiment with activation before/after other layers?
-            net = tf.layers.dense(net, units=units, name='dense%d' % i)
+            dense = tf.layers.Dense(units=units, name='dense%d' % i)
+            net = dense.apply(net)
+            self.weights['W%d' % i] = dense.kernel
+            self.weights['b%d' % i] = dense.bias
             if batchnorm:
-                net = tf.layers.batch_normalization(net, training=self.training,
-                                                    name='batchnorm%d' % i)
+                norm = tf.layers.BatchNormalization(name='batchnorm%d' % i)
+                net = norm.apply(net, training=self.training)
+                self.weights['gamma%d' % i] = norm.gamma
+                self.weights['beta%d' % i] = norm.beta
+                self.weights['mean%d' % i] = norm.moving_mean
+                self.weights['var%d' % i] = norm.moving_variance
+                self.epsilon['eps%d' % i] = norm.epsilon
             net = tf.layers.dropout(net, rate=drop_rate,
                                     training=self.training,
                                     name='dropout%d' % i)
             if activation is not None:
                 net = activation(net, name='activation%d' % i)
         # output layers
-        self.p = tf.layers.dense(net, self.n_act, name='p')
-        tf.add_to_collection('p', self.p)
-        self.v = tf.layers.dense(net, self.n_val, name='v')
-        tf.add_to_collection('v', self.v)
+        for name, units in (('p', self.n_act), ('v', self.n_val)):
+            dense = tf.layers.Dense(units=units, name=name)
+            setattr(self, name, dense.apply(net))
+            tf.add_to_collection(name, getattr(self, name))
+            self.weights['W' + name] = dense.kernel
+            self.weights['b' + name] = dense.bias
 
         # placeholders for input
         self.q = tf.placeholder(tf.float32, [None, self.n_act], name='q')
@@ -221,56 +317,354 @@ class MLP(Model):
         # Saver for model checkpoints
         self.saver = tf.train.Saver()
 
-    def _model(self, obs):
-        assert obs.size == self.n_obs, 'bad obs size {}'.format(obs)
-        feed_dict = {self.obs: obs.flatten()[None, :],  # Add batch dimension
-                     self.training: False}
-        p, v = self.sess.run([self.p, self.v], feed_dict=feed_dict)
-        return p[0], v[0]  # Remove batch dimension
+    def _model_batch(self, obs):
+        feed_dict = {self.obs: obs, self.training: False}
+        return self.sess.run([self.p, self.v], feed_dict=feed_dict)
+
+    def inference(self):
+        return FrozenMLP.from_mlp(self)
+
+    def export(self, path=None):
+        '''
+        Export current weights for inference without tensorflow.
+            path - optionally also save the weights to this .npz file
+        Returns dict of numpy arrays, which can be loaded with FrozenMLP
+        '''
+        assert self.activation in (tf.nn.relu, None), 'Only relu exports'
+        weights = self.sess.run(self.weights)
+        weights.update(self.epsilon)
+        weights['relu'] = self.activation is not None
+        if path is not None:
+            np.savez(path, **weights)
+        return weights
+
+    def _update(self, games):
+        if not self.dense:
+            return super()._update(games)
+        obs, q, z = game_arrays(games)
+        start = time.perf_counter()
+        losses = [self._step(feed_dict)
+                  for feed_dict in prefetch(self._minibatches(obs, q, z))]
+        elapsed = time.perf_counter() - start
+        self.samples_per_sec = len(obs) * self.n_epochs / elapsed
+        print('dense update: {} samples, {:.0f} samples/s'.format(
+            len(obs) * self.n_epochs, self.samples_per_sec))
+        return np.mean(losses)
+
+    def _minibatches(self, obs, q, z):
+        ''' Generate feed dicts of shuffled minibatches for each epoch '''
+        for _ in range(self.n_epochs):
+            order = self.rs.permutation(len(obs))
+            for i in range(0, len(obs), self.batch_size):
+                batch = order[i:i + self.batch_size]
+                yield {self.obs: obs[batch], self.q: q[batch],
+                       self.z: z[batch], self.training: True}
 
     def _sparse_update(self, obs, q, z):
+        feed_dict = {self.obs: obs.reshape(obs.shape[0], -1), self.q: q,
+                     self.z: z, self.training: True}
+        for _ in range(self.step_update):
+            loss = self._step(feed_dict)
+        return loss
+
+    def _step(self, feed_dict):
+        ''' Run one optimizer step, with periodic traces, summaries, saves '''
         global_step = tf.train.get_global_step()
         assert global_step is not None, 'Missing global step tensor!'
+        i = tf.train.global_step(self.sess, global_step)
+
+        # Optionally run a full trace to generate graph info
+        if i % self.step_trace == self.step_trace - 1:
+            run_options = tf.RunOptions(
+                trace_level=tf.RunOptions.FULL_TRACE)
+            run_metadata = tf.RunMetadata()
+        else:
+            run_options = None
+            run_metadata = None
+
+        if i % self.step_summary == self.step_summary - 1:
+            summary, loss, _ = self.sess.run([self.merged, self.loss,
+                                              self.train],
+                                             feed_dict=feed_dict,
+                                             options=run_options,
+                                             run_metadata=run_metadata)
+            self.writer.add_summary(summary, global_step=i)
+        else:
+            loss, _, = self.sess.run([self.loss, self.train],
+                                     feed_dict=feed_dict,
+                                     options=run_options,
+                                     run_metadata=run_metadata)
+
+        # If we generated a trace, write it out
+        if run_metadata is not None:
+            self.writer.add_run_metadata(run_metadata, 'step%d' % i)
+
+        # Save a model checkpoint
+        if i % self.step_save == self.step_save - 1:
+            saved_path = self.saver.save(
+                self.sess, self.save_path, global_step=i)
+            print('Model saved in path:', saved_path)
+        return loss
+
+
+class FrozenMLP(Model):
+    ''' Inference-only numpy version of MLP, see MLP.export() '''
+
+    def __init__(self, *args, weights=None, hidden_units=[10, 10],
+                 scale=0.1, **kwargs):
+        '''
+        Build from exported MLP weights, or random weights if not given.
+            weights - dict of arrays from MLP.export()
+            hidden_units - list of sizes of hidden layers (random weights)
+            scale - standard deviation of random weights
+        Batchnorm is folded into the dense layers, and dropout is skipped.
+        '''
+        super().__init__(*args, **kwargs)
+        if weights is None:
+            weights = dict(relu=True)
+            sizes = [self.n_obs] + list(hidden_units)
+            for i, (a, b) in enumerate(zip(sizes, sizes[1:])):
+                weights['W%d' % i] = self.rs.randn(a, b) * scale
+                weights['b%d' % i] = np.zeros(b)
+            for name, units in (('p', self.n_act), ('v', self.n_val)):
+                weights['W' + name] = self.rs.randn(sizes[-1], units) * scale
+                weights['b' + name] = np.zeros(units)
+        self.relu = bool(weights['relu'])
+        self.layers = []
+        while 'W%d' % len(self.layers) in weights:
+            i = len(self.layers)
+            W = np.asarray(weights['W%d' % i], dtype=float)
+            b = np.asarray(weights['b%d' % i], dtype=float)
+            if 'gamma%d' % i in weights:
+                W, b = batchnorm_fold(W, b, weights['gamma%d' % i],
+                                      weights['beta%d' % i],
+                                      weights['mean%d' % i],
+                                      weights['var%d' % i],
+                                      weights['eps%d' % i])
+            self.layers.append((W, b))
+        # Both heads share one matrix multiply
+        self.W = np.c_[weights['Wp'], weights['Wv']].astype(float)
+        self.b = np.r_[weights['bp'], weights['bv']].astype(float)
+
+    @classmethod
+    def from_weights(cls, weights):
+        ''' Build from a dict of exported weights, sizes taken from them '''
+        first = weights['W0'] if 'W0' in weights else weights['Wp']
+        return cls(weights['Wp'].shape[1], first.shape[0],
+                   weights['Wv'].shape[1], weights=weights)
+
+    @classmethod
+    def from_mlp(cls, mlp):
+        ''' Snapshot the current weights of a tensorflow MLP '''
+        return cls.from_weights(mlp.export())
+
+    @classmethod
+    def load(cls, path):
+        ''' Load weights saved with MLP.export(path) '''
+        with np.load(path) as data:
+            return cls.from_weights(dict(data))
+
+    def _model_batch(self, obs):
+        net = obs
+        for W, b in self.layers:
+            net, _ = mlp_fwd(net, W, b)
+            if self.relu:
+                net, _ = relu_fwd(net)
+        out, _ = mlp_fwd(net, self.W, self.b)
+        return out[:, :self.n_act], out[:, self.n_act:]
+
+
+class NumpyMLP(Model):
+    ''' Trainable MLP in numpy, using the kernels in nn.py and Adam '''
+
+    def __init__(self, *args, hidden_units=[10, 10], learning_rate=0.001,
+                 combination=0.5, step_update=1, dense=False, batch_size=32,
+                 n_epochs=1, scale=0.1, dtype=np.float64, **kwargs):
+        '''
+        Build a relu network with random weights.
+            hidden_units - list of sizes of hidden layers
+            learning_rate - optimization step size
+            combination - linear combination of loss terms
+            step_update - how many steps of optimization per batch
+            dense - train on every position of the games, not a sample
+            batch_size - minibatch size for dense updates
+            n_epochs - passes over the positions for dense updates
+            scale - standard deviation of random weights
+            dtype - floating point type of weights (np.float32 is faster)
+        '''
+        super().__init__(*args, **kwargs)
+        self.c = combination
+        self.learning_rate = learning_rate
+        self.step_update = step_update
+        self.dense = dense
+        self.batch_size = batch_size
+        self.n_epochs = n_epochs
+        self.dtype = dtype
+        sizes = [self.n_obs] + list(hidden_units)
+        # Flat list of W0, b0, W1, b1, ... with both heads fused last
+        self.params = []
+        for a, b in zip(sizes, sizes[1:] + [self.n_act + self.n_val]):
+            self.params.append((self.rs.randn(a, b) * scale).astype(dtype))
+            self.params.append(np.zeros(b, dtype=dtype))
+        self.m = [np.zeros_like(p) for p in self.params]
+        self.v = [np.zeros_like(p) for p in self.params]
+        self.t = 0  # Number of optimizer steps taken
+        self.samples_per_sec = 0.0  # Throughput of the last update
+
+    def _forward(self, obs):
+        ''' Returns network output and caches for the backward pass '''
+        net = obs.astype(self.dtype, copy=False)
+        caches = []
+        for i in range(0, len(self.params) - 2, 2):
+            net, cache = mlp_fwd(net, self.params[i], self.params[i + 1])
+            caches.append(cache)
+            net, cache = relu_fwd(net)
+            caches.append(cache)
+        out, cache = mlp_fwd(net, self.params[-2], self.params[-1])
+        caches.append(cache)
+        return out, caches
+
+    def _model_batch(self, obs):
+        out, _ = self._forward(obs)
+        return out[:, :self.n_act], out[:, self.n_act:]
+
+    def _step(self, obs, q, z):
+        ''' Run one optimizer step on a batch, returns mean loss '''
+        out, caches = self._forward(obs)
+        loss, cache = loss_fwd(out, q, z, self.c)
+        dnet = loss_bak(np.full_like(loss, 1 / len(obs)), cache)
+        grads = []
+        dnet, dW, db = mlp_bak(dnet, caches.pop())
+        grads += [db, dW]
+        while caches:
+            dnet = relu_bak(dnet, caches.pop())
+            dnet, dW, db = mlp_bak(dnet, caches.pop())
+            grads += [db, dW]
+        self.t += 1
+        for p, g, m, v in zip(self.params, reversed(grads), self.m, self.v):
+            adam(p, g, m, v, self.t, self.learning_rate)
+        return np.mean(loss)
+
+    def _update(self, games):
+        if not self.dense:
+            return super()._update(games)
+        obs, q, z = game_arrays(games, self.dtype)
+        start = time.perf_counter()
+        losses = []
+        for _ in range(self.n_epochs):
+            order = self.rs.permutation(len(obs))
+            for i in range(0, len(obs), self.batch_size):
+                batch = order[i:i + self.batch_size]
+                losses.append(self._step(obs[batch], q[batch], z[batch]))
+        elapsed = time.perf_counter() - start
+        self.samples_per_sec = len(obs) * self.n_epochs / elapsed
+        return np.mean(losses)
+
+    def _sparse_update(self, obs, q, z):
+        obs = np.asarray(obs, self.dtype).reshape(len(obs), self.n_obs)
+        q = np.asarray(q, self.dtype)
+        z = np.asarray(z, self.dtype)
         for _ in range(self.step_update):
-            i = tf.train.global_step(self.sess, global_step)
-            print('step:', i)
-
-            # Optionally run a full trace to generate graph info
-            if i % self.step_trace == self.step_trace - 1:
-                run_options = tf.RunOptions(
-                    trace_level=tf.RunOptions.FULL_TRACE)
-                run_metadata = tf.RunMetadata()
-            else:
-                run_options = None
-                run_metadata = None
-
-            # Generate dataset to train on
-            feed_dict = {self.obs: obs.reshape(obs.shape[0], -1), self.q: q,
-                         self.z: z, self.training: True}
-            if i % self.step_summary == self.step_summary - 1:
-                summary, loss, _ = self.sess.run([self.merged, self.loss,
-                                                  self.train],
-                                                 feed_dict=feed_dict,
-                                                 options=run_options,
-                                                 run_metadata=run_metadata)
-                self.writer.add_summary(summary, global_step=i)
+            loss = self._step(obs, q, z)
+        return loss
+
+    def export(self, path=None):
+        '''
+        Export current weights in the format of MLP.export()
+            path - optionally also save the weights to this .npz file
+        '''
+        weights = dict(relu=True)
+        for i in range(0, len(self.params) - 2, 2):
+            weights['W%d' % (i // 2)] = self.params[i].copy()
+            weights['b%d' % (i // 2)] = self.params[i + 1].copy()
+        W, b = self.params[-2:]
+        weights.update(Wp=W[:, :self.n_act].copy(), bp=b[:self.n_act].copy(),
+                       Wv=W[:, self.n_act:].copy(), bv=b[self.n_act:].copy())
+        if path is not None:
+            np.savez(path, **weights)
+        return weights
+
+    def inference(self):
+        return FrozenMLP.from_weights(self.export())
+
+
+class Cached(Model):
+    ''' Least-recently-used cache of another model's evaluations '''
+
+    def __init__(self, model, max_bytes=2 ** 26, **kwargs):
+        '''
+        Wrap model, caching results by observation bytes.
+            max_bytes - memory budget for keys and cached results
+        The cache is emptied whenever the model's n_updates changes.
+        '''
+        super().__init__(model.n_act, model.n_obs, model.n_val, **kwargs)
+        self.wrapped = model
+        self.max_bytes = max_bytes
+        self.cache = OrderedDict()  # Map from obs bytes -> (logits, values)
+        self.nbytes = 0
+        self.version = model.n_updates
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        self.cache.clear()
+        self.nbytes = 0
+        self.version = self.wrapped.n_updates
+
+    def _model_batch(self, obs):
+        if self.version != self.wrapped.n_updates:
+            self.clear()
+        logits = np.empty((len(obs), self.n_act))
+        values = np.empty((len(obs), self.n_val))
+        keys = [o.tobytes() for o in obs]
+        misses = []
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key, None)
+            if cached is None:
+                misses.append(i)
             else:
-                loss, _, = self.sess.run([self.loss, self.train], feed_dict=feed_dict,
-                                         options=run_options, run_metadata=run_metadata)
+                self.cache.move_to_end(key)
+                logits[i], values[i] = cached
+        self.hits += len(obs) - len(misses)
+        self.misses += len(misses)
+        if misses:
+            logits[misses], values[misses] = self.wrapped.model_batch(
+                obs[misses])
+            for i in misses:
+                self.store(keys[i], logits[i].copy(), values[i].copy())
+        return logits, values
 
-            # If we generated a trace, write it out
-            if run_metadata is not None:
-                self.writer.add_run_metadata(run_metadata, 'step%d' % i)
-                print('Saved metadata for step:', i)
+    def store(self, key, logits, values):
+        ''' Add a result to the cache, evicting to stay in budget '''
+        if key in self.cache:
+            return
+        self.cache[key] = logits, values
+        self.nbytes += len(key) + logits.nbytes + values.nbytes
+        while self.nbytes > self.max_bytes:
+            key, (logits, values) = self.cache.popitem(last=False)
+            self.nbytes -= len(key) + logits.nbytes + values.nbytes
+            self.evictions += 1
+
+    def stats(self):
+        ''' Cache size and hit rate '''
+        lookups = max(self.hits + self.misses, 1)
+        return dict(size=len(self.cache), nbytes=self.nbytes,
+                    hits=self.hits, misses=self.misses,
+                    hit_rate=self.hits / lookups, evictions=self.evictions)
+
+    def inference(self):
+        return Cached(self.wrapped.inference(), max_bytes=self.max_bytes)
 
-            # Save a model checkpoint
-            if i % self.step_save == self.step_save - 1:
-                saved_path = self.saver.save(
-                    self.sess, self.save_path, global_step=i)
-                print('Model saved in path:', saved_path)
+    def update(self, games):
+        ''' Update the wrapped model, which keeps the replay buffer '''
+        self.n_updates += 1
+        loss = self.wrapped.update(games)
+        self.clear()
+        return loss
 
 
-models = [Uniform, Linear, Memorize, MLP]
+models = [Uniform, Linear, Memorize, MLP, FrozenMLP, NumpyMLP]
 
 
 if __name__ == '__main__':
@@ -33,6 +33,12 @@ def mlp_bak(dout, cache):
     return dx, dW, db
 
 
+def batchnorm_fold(W, b, gamma, beta, mean, var, eps):
+    ''' fold inference-mode batchnorm into the preceding dense layer '''
+    scale = gamma / np.sqrt(var + eps)
+    return W * scale, (b - mean) * scale + beta
+
+
 def loss_fwd(x, q, z, c):
     ''' softmax cross-entropy and mean-squared-error combination - forward '''
     _, P = q.shape
@@ -50,8 +56,18 @@ def loss_bak(dout, cache):
     ''' softmax cross-entropy and mean-squared-error combination - backward '''
     q, e, Z, d, c = cache
     D, P = q.shape
-    dx = np.empty((D, P + d.shape[1]))
+    dx = np.empty((D, P + d.shape[1]), dtype=q.dtype)
     dx[:, P:] = 2 * d * (1 - c) * dout
     dx[:, :P] = -c * dout * q
     dx[:, :P] -= e * (np.sum(dx[:, :P], axis=1, keepdims=True) / Z)
     return dx
+
+
+def adam(x, dx, m, v, t, lr=0.001, beta1=0.9, beta2=0.999, eps=1e-8):
+    ''' adam optimizer step t (from 1) - updates x, m and v in place '''
+    m *= beta1
+    m += (1 - beta1) * dx
+    v *= beta2
+    v += (1 - beta2) * np.square(dx)
+    step = lr * np.sqrt(1 - beta2 ** t) / (1 - beta1 ** t)
+    x -= step * m / (np.sqrt(v) + eps)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+import os
+import json
+import numpy as np
+
+
+class ReplayBuffer:
+    ''' Fixed capacity ring buffer of (observation, probabilities, outcome) '''
+
+    def __init__(self, n_obs, n_act, n_val, capacity=10000, dtype=np.float32):
+        '''
+        Preallocate storage for capacity positions, oldest are overwritten
+            n_obs, n_act, n_val - sizes of observation, probs and outcome
+        '''
+        self.capacity = capacity
+        self.obs = np.zeros((capacity, n_obs), dtype=dtype)
+        self.q = np.zeros((capacity, n_act), dtype=dtype)
+        self.z = np.zeros((capacity, n_val), dtype=dtype)
+        self.size = 0  # Number of positions stored
+        self.index = 0  # Where the next position goes
+
+    def __len__(self):
+        return self.size
+
+    def append(self, obs, q, z):
+        ''' Add a single position '''
+        i = self.index
+        self.obs[i] = np.ravel(obs)
+        self.q[i] = q
+        self.z[i] = z
+        self.index = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def add_games(self, games):
+        '''
+        Add every position of a list of games, see AlphaZero.play()
+        Returns the number of positions added.
+        '''
+        n = 0
+        for trajectory, outcome in games:
+            for obs, q in trajectory:
+                self.append(obs, q, outcome)
+                n += 1
+        return n
+
+    def sample(self, n, rs=np.random, replace=False):
+        ''' Sample a minibatch of (observations, probabilities, outcomes) '''
+        assert self.size > 0, 'Empty buffer'
+        if not replace:
+            n = min(n, self.size)
+        i = rs.choice(self.size, n, replace=replace)
+        return self.obs[i], self.q[i], self.z[i]
+
+
+class ReplayStore:
+    '''
+    Persistent replay data, as fixed-width records in memory-mapped shard
+    files with a small JSON index.  Has the same add_games() and sample()
+    interface as ReplayBuffer, so it can be used as Model.buffer.
+    Any number of readers can open the same store while one writer adds.
+    '''
+    index_name = 'index.json'
+    shard_name = 'shard-{:05d}.dat'
+
+    def __init__(self, path, n_obs=None, n_act=None, n_val=None,
+                 shard_size=2 ** 16, readonly=False):
+        '''
+        Open the store in directory path, creating it if needed
+            n_obs, n_act, n_val - record sizes, only needed to create it
+            shard_size - number of records per shard file
+            readonly - open shards read-only, for readers
+        '''
+        self.path = path
+        self.readonly = readonly
+        self.shards = []  # Memory maps, opened as needed
+        index_path = os.path.join(path, self.index_name)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+        else:
+            assert not readonly, 'No store at {}'.format(path)
+            assert None not in (n_obs, n_act, n_val), 'Need record sizes'
+            os.makedirs(path, exist_ok=True)
+            self.index = dict(n_obs=n_obs, n_act=n_act, n_val=n_val,
+                              shard_size=shard_size, size=0,
+                              dtype='float32')
+            self.flush()
+        dtype = self.index['dtype']
+        self.dtype = np.dtype([('obs', dtype, (self.index['n_obs'],)),
+                               ('q', dtype, (self.index['n_act'],)),
+                               ('z', dtype, (self.index['n_val'],))])
+        self.shard_size = self.index['shard_size']
+
+    def __len__(self):
+        return self.index['size']
+
+    def flush(self):
+        ''' Flush written records and update the index file '''
+        for shard in self.shards:
+            if not self.readonly:
+                shard.flush()
+        path = os.path.join(self.path, self.index_name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.index, f)
+        os.replace(path + '.tmp', path)
+
+    def refresh(self):
+        ''' Re-read the index, to see records added by another writer '''
+        with open(os.path.join(self.path, self.index_name)) as f:
+            self.index['size'] = json.load(f)['size']
+
+    def shard(self, k):
+        ''' Memory map of shard k, creating the file if needed '''
+        while len(self.shards) <= k:
+            path = os.path.join(self.path,
+                                self.shard_name.format(len(self.shards)))
+            if self.readonly:
+                mode = 'r'
+            else:
+                mode = 'r+' if os.path.exists(path) else 'w+'
+            self.shards.append(np.memmap(path, dtype=self.dtype, mode=mode,
+                                         shape=(self.shard_size,)))
+        return self.shards[k]
+
+    def append(self, obs, q, z):
+        ''' Add a single position, call flush() to make it visible '''
+        assert not self.readonly, 'Read-only store'
+        k, i = divmod(self.index['size'], self.shard_size)
+        record = self.shard(k)[i]
+        record['obs'] = np.ravel(obs)
+        record['q'] = q
+        record['z'] = z
+        self.index['size'] += 1
+
+    def add_games(self, games):
+        '''
+        Add every position of an iterable of games, see AlphaZero.play()
+        Games can come from a generator, e.g. AlphaZero.play_parallel().
+        Returns the number of positions added.
+        '''
+        n = 0
+        for trajectory, outcome in games:
+            for obs, q in trajectory:
+                self.append(obs, q, outcome)
+                n += 1
+        self.flush()
+        return n
+
+    def records(self, start, stop):
+        '''
+        Records start:stop as (observations, probabilities, outcomes)
+        views into the memory map, without copying.  Must be in one shard.
+        '''
+        k, i = divmod(start, self.shard_size)
+        assert 0 <= start <= stop <= len(self), 'Out of range'
+        assert stop - k * self.shard_size <= self.shard_size, 'Spans shards'
+        records = self.shard(k)[i:i + stop - start]
+        return records['obs'], records['q'], records['z']
+
+    def sample(self, n, rs=np.random, replace=False):
+        ''' Sample a minibatch of (observations, probabilities, outcomes) '''
+        size = len(self)
+        assert size > 0, 'Empty store'
+        if not replace:
+            n = min(n, size)
+        index = rs.choice(size, n, replace=replace)
+        batch = np.empty(n, dtype=self.dtype)
+        shards, offsets = np.divmod(index, self.shard_size)
+        for k in np.unique(shards):
+            mask = shards == k
+            batch[mask] = self.shard(k)[offsets[mask]]
+        return batch['obs'], batch['q'], batch['z']
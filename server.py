@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+import time
+import queue
+import threading
+import multiprocessing
+import numpy as np
+
+from model import Model
+
+
+class InferenceClient(Model):
+    ''' Model that forwards calls to an InferenceServer '''
+
+    def __init__(self, *args, index, requests, responses, **kwargs):
+        '''
+        Use InferenceServer.clients instead of building directly
+            index - which client this is, used to route responses
+            requests - queue shared by all clients to submit to the server
+            responses - queue only this client receives results on
+        '''
+        super().__init__(*args, **kwargs)
+        self.index = index
+        self.requests = requests
+        self.responses = responses
+
+    def _model_batch(self, obs):
+        self.requests.put((self.index, obs, time.time()))
+        return self.responses.get()
+
+    def _update(self, games):
+        raise NotImplementedError('Update the model owned by the server')
+
+
+class InferenceServer:
+    ''' Own a model and evaluate batched requests from many processes '''
+
+    def __init__(self, model, n_clients=1, max_batch=64, timeout=1e-3,
+                 context=multiprocessing):
+        '''
+        Serve model to n_clients clients (use one per process).
+            max_batch - most observations to evaluate in one model call
+            timeout - longest time to wait for a batch to fill up, seconds
+            context - multiprocessing context to make queues with
+        '''
+        self.model = model
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.requests = context.Queue()
+        self.clients = [InferenceClient(model.n_act, model.n_obs, model.n_val,
+                                        index=i, requests=self.requests,
+                                        responses=context.Queue())
+                        for i in range(n_clients)]
+        self.thread = None
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_obs = 0
+        self.max_size = 0
+        self.latency = 0.0  # Total seconds requests spent in the queue
+
+    def start(self):
+        ''' Start serving in a background thread '''
+        assert self.thread is None, 'Already started'
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        ''' Stop serving, after finishing all submitted requests '''
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def serve(self):
+        '''
+        Evaluate batches of requests until stopped.  A request that would
+        take a batch past max_batch starts the next batch instead, so only
+        a single request bigger than max_batch is evaluated past it.
+        '''
+        running = True
+        pending = None  # Request that didn't fit in the last batch
+        while running or pending is not None:
+            if pending is None:
+                request = self.requests.get()
+            else:
+                request, pending = pending, None
+            if request is None:
+                break
+            batch = [request]
+            size = len(request[1])
+            deadline = time.time() + self.timeout
+            while running and size < self.max_batch:
+                try:
+                    request = self.requests.get(
+                        timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    running = False
+                    break
+                if size + len(request[1]) > self.max_batch:
+                    pending = request
+                    break
+                batch.append(request)
+                size += len(request[1])
+            self.evaluate(batch)
+
+    def evaluate(self, batch):
+        ''' Evaluate a list of (client, obs, submit time) requests '''
+        now = time.time()
+        logits, values = self.model.model_batch(
+            np.concatenate([obs for _, obs, _ in batch]))
+        start = 0
+        for index, obs, submitted in batch:
+            end = start + len(obs)
+            self.clients[index].responses.put((logits[start:end],
+                                               values[start:end]))
+            self.latency += now - submitted
+            start = end
+        self.n_requests += len(batch)
+        self.n_batches += 1
+        self.n_obs += start
+        self.max_size = max(self.max_size, start)
+
+    def stats(self):
+        ''' Batch size and queue latency statistics '''
+        return dict(requests=self.n_requests,
+                    batches=self.n_batches,
+                    mean_batch_size=self.n_obs / max(self.n_batches, 1),
+                    max_batch_size=self.max_size,
+                    mean_latency=self.latency / max(self.n_requests, 1))
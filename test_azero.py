@@ -2,10 +2,11 @@
 
 import unittest
 import numpy as np
+from unittest import mock
 from itertools import product
-from game import games, Narrow
-from model import models, Uniform
-from azero import AlphaZero
+from game import games, Narrow, MNOP
+from model import models, Uniform, Linear, NumpyMLP
+from azero import AlphaZero, Tree, TranspositionTable
 from util import sample_probs
 
 N = 100
@@ -24,6 +25,201 @@ class TestAlphaZero(unittest.TestCase):
                     action = sample_probs(probs)
                     state, player, outcome = game.step(state, player, action)
 
+    def test_play_batch(self):
+        for game_cls, model_cls in product(games, models):
+            game = game_cls()
+            model = model_cls(game.n_action, game.n_view, game.n_player)
+            azero = AlphaZero(game, model, sims_per_search=10, batch_size=4)
+            state, player, outcome = game.start()
+            while outcome is None:
+                probs, tree = azero.search(state, player)
+                self.assertEqual(tree.T, 10)
+                action = sample_probs(probs)
+                state, player, outcome = game.step(state, player, action)
+
+    def test_play_reuse(self):
+        for game_cls, model_cls in product(games, models):
+            game = game_cls()
+            model = model_cls(game.n_action, game.n_view, game.n_player)
+            azero = AlphaZero(game, model, sims_per_search=10,
+                              reuse_tree=True, max_reuse_nodes=5)
+            tree = None
+            state, player, outcome = game.start()
+            while outcome is None:
+                probs, tree = azero.search(state, player, tree=tree)
+                self.assertGreaterEqual(tree.T, 10)
+                action = sample_probs(probs)
+                state, player, outcome = game.step(state, player, action)
+                tree = azero.next_tree(tree, action)
+                if tree is not None:
+                    self.assertLessEqual(tree.size(), 5)
+
+    def test_simulate(self):
+        # Visit counts from the original recursive simulate()
+        game = MNOP()
+        model = Linear(game.n_action, game.n_view, game.n_player,
+                       seed=0, scale=1.0)
+        azero = AlphaZero(game, model, sims_per_search=200)
+        state, player, _ = game.start()
+        state, player, _ = game.step(state, player, 4)
+        _, tree = azero.search(state, player)
+        np.testing.assert_equal(tree.N, [4, 8, 4, 30, 0, 19, 27, 10, 98])
+
+    def test_cached_states(self):
+        game = MNOP()
+        model = Linear(game.n_action, game.n_view, game.n_player, seed=0)
+        azero = AlphaZero(game, model, sims_per_search=2000)
+        state, player, _ = game.start()
+        for action in (4, 0, 8, 2):  # Search settles on a few lines of play
+            state, player, _ = game.step(state, player, action)
+        _, tree = azero.search(state, player)
+        size = tree.size()
+        steps = []
+        step = game.step_unchecked
+        game.step_unchecked = lambda *args: steps.append(args) or step(*args)
+        azero.search(state, player, sims_per_search=5000, tree=tree)
+        # No new nodes, so no game steps: terminal nodes stay materialized
+        self.assertEqual(tree.size(), size)
+        self.assertEqual(steps, [])
+        for node in tree.nodes():
+            for action, child in node.children.items():
+                if child.materialized:
+                    np.testing.assert_equal((child.state, child.player,
+                                             child.outcome),
+                                            step(node.state, node.player,
+                                                 action))
+
+    def test_train(self):
+        weights = []
+        for n_workers in (2, 3):
+            azero = AlphaZero.make(MNOP, NumpyMLP, seed=0, sims_per_search=10)
+            azero.train(n_epochs=2, n_games=3, n_workers=n_workers)
+            self.assertEqual(azero._model.n_updates, 2)
+            weights.append(azero._model.params)
+        for a, b in zip(*weights):  # Results only depend on our seed
+            np.testing.assert_array_equal(a, b)
+
+    def test_train_pipelined(self):
+        azero = AlphaZero.make(MNOP, NumpyMLP, seed=0, sims_per_search=10,
+                               table=TranspositionTable())
+        stats = azero.train_pipelined(n_updates=3, n_games=4, n_workers=2,
+                                      max_staleness=0)
+        self.assertEqual(azero._model.n_updates, 3)
+        self.assertGreaterEqual(stats['games'] - stats['stale_games'], 12)
+        self.assertGreater(stats['stale_games'], 0)
+        self.assertGreater(stats['games_per_sec'], 0)
+        self.assertGreater(stats['updates_per_sec'], 0)
+
+    def test_table(self):
+        game = MNOP()
+        model = Linear(game.n_action, game.n_view, game.n_player, seed=0)
+        for batch_size in (1, 4):
+            table = TranspositionTable()
+            azero = AlphaZero(game, model, sims_per_search=1000, table=table,
+                              batch_size=batch_size)
+            state, player, _ = game.start()
+            _, tree = azero.search(state, player)
+            self.assertEqual(tree.T, 1000)
+            stats = table.stats()
+            self.assertGreater(stats['hits'], 0)
+            self.assertGreater(stats['transpositions'], 0)
+            plain = AlphaZero(game, model, sims_per_search=1000,
+                              batch_size=batch_size)
+            self.assertLess(tree.size(), plain.search(state, player)[1].size())
+            # Searching the same position again re-uses the shared root
+            self.assertIs(azero.search(state, player)[1], tree)
+        # Table size is bounded
+        table = TranspositionTable(max_size=10)
+        azero = AlphaZero(game, model, sims_per_search=50, table=table)
+        azero.play()
+        self.assertLessEqual(len(table), 10)
+
+    def test_tree(self):
+        rs = np.random.RandomState(0)
+        tree = Tree(rs.dirichlet(np.ones(5)), c_puct=1.0)
+        for _ in range(N):
+            valid = rs.rand(5) < 0.7
+            valid[rs.randint(5)] = True
+            action, child = tree.select(valid)
+            expected = np.argmax(np.where(valid, tree.values, -np.inf))
+            self.assertEqual(action, expected)
+            if child is None:
+                tree.leaf(action, rs.dirichlet(np.ones(5)))
+            tree.backup(action, rs.randn())
+        self.assertEqual(tree.T, N)
+        self.assertEqual(tree.N.sum(), N)
+        self.assertTrue(np.issubdtype(tree.N.dtype, np.integer))
+        self.assertEqual(tree.size(), 1 + len(tree.children))
+        self.assertGreater(tree.nbytes(), tree.size() * tree.N.nbytes)
+        action = max(tree.children, key=lambda a: tree.N[a])
+        child = tree.children[action]
+        self.assertIs(tree.subtree(action, max_nodes=1), child)
+        self.assertEqual(child.size(), 1)
+        tree.prune(3)
+        self.assertEqual(tree.size(), min(3, 1 + len(tree.children)))
+
+    def test_select(self):
+        rs = np.random.RandomState(0)
+        cases = product((5, 50), (True, False), (Tree.loop_size, 50),
+                        (0.7, 0.1))
+        for n, uniform, loop_size, density in cases:
+            prior = np.ones(n) / n
+            if not uniform:
+                prior = rs.dirichlet(np.ones(n))
+            tree = Tree(prior, c_puct=1.0)
+            valid = rs.rand(n) < density
+            valid[rs.randint(n)] = True
+            pending = []
+            # Score up to loop_size touched actions without select_dense()
+            with mock.patch.object(Tree, 'loop_size', loop_size):
+                for i in range(300):
+                    if i % 50 == 0:  # Valid actions can change between calls
+                        valid = rs.rand(n) < density
+                        valid[rs.randint(n)] = True
+                    action, _ = tree.select(valid)
+                    self.assertEqual(action, tree.select_dense(valid)[0])
+                    # Mix backups with virtual losses added and reverted
+                    if rs.rand() < 0.3:
+                        tree.add_loss(action, 1.0)
+                        pending.append(action)
+                    elif pending and rs.rand() < 0.5:
+                        tree.revert_loss(pending.pop(), 1.0)
+                    else:
+                        tree.backup(action, rs.choice([-1.0, 0.0, 1.0]))
+
+    def test_play_parallel(self):
+        game = MNOP()
+        model = Linear(game.n_action, game.n_view, game.n_player, seed=0)
+        for table in (False, True):
+            results = []
+            for n_workers in (2, 2, 2, 3):
+                azero = AlphaZero(game, model, seed=0, sims_per_search=30,
+                                  table=TranspositionTable() if table
+                                  else None)
+                results.append(azero.play_multi(n_games=16,
+                                                n_workers=n_workers))
+            for played in results[1:]:
+                self.assertEqual(len(played), len(results[0]))
+                for (traj, out), (first_traj, first_out) in zip(played,
+                                                                results[0]):
+                    np.testing.assert_equal(out, first_out)
+                    for (obs, probs), (first_obs, first_probs) in zip(
+                            traj, first_traj):
+                        np.testing.assert_equal(obs, first_obs)
+                        np.testing.assert_equal(probs, first_probs)
+            if table:  # Each game only depends on its own seed
+                azero = AlphaZero(game, model, seed=0, sims_per_search=30,
+                                  table=TranspositionTable())
+                for seed, (traj, out) in zip(
+                        azero.rs.randint(2 ** 31, size=16).tolist(),
+                        results[0]):
+                    azero.seed(seed)
+                    azero.table.clear()
+                    alone, alone_out = azero.play()
+                    np.testing.assert_equal(out, alone_out)
+                    for (_, probs), (_, alone_probs) in zip(traj, alone):
+                        np.testing.assert_equal(probs, alone_probs)
+
     def check_rank(self, prob, rank):
         assert (-np.sort(-prob) == prob[rank]).all()
 
@@ -41,6 +237,17 @@ class TestAlphaZero(unittest.TestCase):
         probs, _ = azero.search(state, player)
         self.check_rank(probs, [0, 1, 2])
 
+    def test_search_batch(self):
+        game = Narrow()
+        model = Uniform(game.n_action, game.n_view, game.n_player)
+        azero = AlphaZero(game, model, batch_size=8)
+        state, player, _ = game.start()
+        probs, _ = azero.search(state, player)
+        self.check_rank(probs, [2, 1, 0])
+        state, player, _ = game.step(state, player, 2)
+        probs, _ = azero.search(state, player)
+        self.check_rank(probs, [1, 0, 2])
+
 
 if __name__ == '__main__':
     unittest.main()
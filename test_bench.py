@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+
+import unittest
+import bench
+
+
+class TestBench(unittest.TestCase):
+    def test_compare(self):
+        baseline = dict(a=1.0, b=1.0, c=1.0, old=1.0)
+        results = dict(a=1.05, b=1.2, c=0.5, new=1.0)
+        self.assertEqual(bench.compare(baseline, results, 0.1), ['b'])
+        self.assertEqual(bench.compare(baseline, results, 0.3), [])
+
+    def test_tree(self):
+        results = bench.bench_tree(cases=((9, None), (20, 3)), n_visits=10)
+        self.assertEqual(sorted(results),
+                         ['tree/backup/20/3valid', 'tree/backup/9',
+                          'tree/select/20/3valid', 'tree/select/9',
+                          'tree/select_dense/20/3valid',
+                          'tree/select_dense/9'])
+        self.assertTrue(all(t > 0 for t in results.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
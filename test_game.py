@@ -8,7 +8,7 @@ from itertools import product
 from util import sample_logits
 from game import (games, Game,
                   Null, Binary, Flip, Count, Narrow, Matching, Roshambo,
-                  Modulo, Connect3, MNOP)
+                  Modulo, Connect3, BitConnect3, Nim, MNOP, BitMNOP)
 
 N = 100
 
@@ -58,6 +58,49 @@ class TestGames(unittest.TestCase):
                 # End of game checks
                 self.assertIsNone(player)
 
+    def test_unchecked(self):
+        for game_cls in games:
+            game = game_cls()
+            for _ in range(N):
+                state, player, outcome = game.start()
+                while outcome is None:
+                    valid = game.valid(state, player)
+                    self.assertEqual(tuple(valid),
+                                     tuple(game.valid_unchecked(state, player)))
+                    np.testing.assert_equal(
+                        game.view(state, player),
+                        np.asarray(game.view_unchecked(state, player),
+                                   dtype=float))
+                    action = sample_logits((0,) * len(valid), valid)
+                    fast = game.step_unchecked(state, player, action)
+                    state, player, outcome = game.step(state, player, action)
+                    self.assertEqual(fast[0], state)
+                    self.assertEqual(fast[1], player)
+                    if outcome is not None:
+                        np.testing.assert_equal(fast[2], outcome)
+
+    def test_bit_connect3(self):
+        ''' Ensure BitConnect3 plays exactly like Connect3 '''
+        slow, fast = Connect3(), BitConnect3()
+        for _ in range(N):
+            state, player, outcome = slow.start()
+            bits, bit_player, bit_outcome = fast.start()
+            while outcome is None:
+                self.assertEqual(player, bit_player)
+                self.assertIsNone(bit_outcome)
+                valid = tuple(slow.valid(state, player))
+                self.assertEqual(valid, fast.valid(bits, player))
+                view = fast.view(bits, player)
+                np.testing.assert_equal(view[0], state == player)
+                np.testing.assert_equal(view[1], state == 1 - player)
+                action = sample_logits((0,) * len(valid), valid)
+                state, player, outcome = slow.step(state, player, action)
+                bits, bit_player, bit_outcome = fast.step(bits, bit_player,
+                                                          action)
+                self.assertEqual(slow.human(state), fast.human(bits))
+            self.assertIsNone(bit_player)
+            np.testing.assert_equal(outcome, bit_outcome)
+
     def check_trajectory(self, game, traj, out):
         state, player, outcome = game.start()
         for action in traj:
@@ -122,6 +165,20 @@ class TestGames(unittest.TestCase):
         self.check_trajectory(Connect3(), (0, 1, 0, 2, 4, 3), (-1, 1))
         self.check_trajectory(Connect3(), (0, 1, 1, 2, 3, 2, 2), (1, -1))
         self.check_trajectory(Connect3(), (1, 2, 0, 1, 0, 0), (-1, 1))
+        self.check_trajectory(BitConnect3(), (0, 1, 0, 1, 0), (1, -1))
+        self.check_trajectory(BitConnect3(), (0, 1, 0, 2, 4, 3), (-1, 1))
+        self.check_trajectory(BitConnect3(), (0, 1, 1, 2, 3, 2, 2), (1, -1))
+        self.check_trajectory(BitConnect3(), (1, 2, 0, 1, 0, 0), (-1, 1))
+        with self.assertRaises(AssertionError):
+            self.check_trajectory(BitConnect3(), (0,) * 5, None)
+        self.check_trajectory(Nim(), (0, 7, 14), (1, -1))
+        self.check_trajectory(Nim(), (1, 0, 7, 14), (-1, 1))
+        self.check_trajectory(Nim(), (16, 15, 14, 8, 7, 2, 0), (1, -1))
+        self.check_trajectory(Nim((2, 3), 3), (4, 0, 3), (-1, -1, 2))
+        with self.assertRaises(AssertionError):
+            self.check_trajectory(Nim(), (0, 0), None)
+        with self.assertRaises(AssertionError):
+            self.check_trajectory(Nim(), (3,), None)
         self.check_trajectory(MNOP(), (0, 3, 1, 4, 2), (1, -1))
         self.check_trajectory(MNOP(), (0, 1, 4, 2, 8), (1, -1))
         self.check_trajectory(MNOP(), (0, 1, 3, 2, 6), (1, -1))
@@ -136,6 +193,37 @@ class TestGames(unittest.TestCase):
             self.check_trajectory(MNOP(), (0, 0), None)
         with self.assertRaises(AssertionError):
             self.check_trajectory(MNOP(), (0, 1, 1), None)
+        self.check_trajectory(BitMNOP(), (0, 3, 1, 4, 2), (1, -1))
+        self.check_trajectory(BitMNOP(), (0, 1, 4, 2, 8), (1, -1))
+        self.check_trajectory(BitMNOP(), (2, 1, 4, 0, 6), (1, -1))
+        self.check_trajectory(BitMNOP(), (3, 6, 1, 4, 5, 2), (-1, 1))
+        self.check_trajectory(BitMNOP(2, 2, 2), (0, 1, 3), (1, -1))
+        with self.assertRaises(AssertionError):
+            self.check_trajectory(BitMNOP(), (0, 0), None)
+
+    def test_bit_mnop(self):
+        ''' Ensure BitMNOP plays exactly like MNOP '''
+        for args in ((3, 3, 3), (2, 2, 2), (4, 4, 3), (5, 5, 4), (4, 4, 3, 3)):
+            slow, fast = MNOP(*args), BitMNOP(*args)
+            self.assertEqual(fast.n_state, len(fast.start()[0]))
+            for _ in range(N):
+                state, player, outcome = slow.start()
+                bits, bit_player, bit_outcome = fast.start()
+                while outcome is None:
+                    self.assertEqual(player, bit_player)
+                    self.assertIsNone(bit_outcome)
+                    valid = slow.valid(state, player)
+                    self.assertEqual(valid, fast.valid(bits, player))
+                    np.testing.assert_equal(slow.view(state, player),
+                                            fast.view(bits, player))
+                    action = sample_logits((0,) * len(valid), valid)
+                    state, player, outcome = slow.step(state, player, action)
+                    bits, bit_player, bit_outcome = fast.step(bits,
+                                                              bit_player,
+                                                              action)
+                self.assertIsNone(bit_player)
+                np.testing.assert_equal(outcome, bit_outcome)
+                self.assertEqual(slow.human(state), fast.human(bits))
 
     def check_conditional_independence(self, data):
         ''' Ensure conditional independence of X and Y given Z '''
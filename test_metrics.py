@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import io
+import json
+import unittest
+from game import MNOP
+from model import Linear
+from azero import AlphaZero
+from metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def test_metrics(self):
+        metrics = Metrics()
+        metrics.count('a')
+        metrics.count('a', 2)
+        metrics.lap('phase')
+        for x in (1, 2, 6):
+            metrics.observe('x', x)
+        stats = metrics.stats()
+        self.assertEqual(stats['a'], 3)
+        self.assertGreaterEqual(stats['phase_time'], 0)
+        self.assertEqual(stats['x_mean'], 3)
+        self.assertEqual(stats['x_max'], 6)
+        metrics.reset()
+        self.assertEqual(metrics.stats(), dict())
+
+    def test_play(self):
+        game = MNOP()
+        model = Linear(game.n_action, game.n_view, game.n_player, seed=0)
+        stream = io.StringIO()
+        azero = AlphaZero(game, model, seed=0, sims_per_search=50,
+                          metrics=Metrics(stream))
+        trajectory, _ = azero.play()
+        stats = azero.metrics.stats()
+        self.assertEqual(stats['games'], 1)
+        self.assertEqual(stats['moves'], len(trajectory))
+        self.assertEqual(stats['simulations'], 50 * len(trajectory))
+        self.assertEqual(stats['model_calls'], stats['model_positions'])
+        self.assertLessEqual(stats['game_steps'], stats['simulations'])
+        self.assertGreater(stats['tree_depth_max'], 1)
+        for phase in ('select', 'backup', 'model', 'step'):
+            self.assertGreater(stats[phase + '_time'], 0)
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([e['event'] for e in events],
+                         ['move'] * len(trajectory) + ['game'])
+
+
+if __name__ == '__main__':
+    unittest.main()
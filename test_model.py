@@ -1,10 +1,16 @@
 #!/usr/bin/env python
 
+import os
+import sys
 import random
+import subprocess
+import tempfile
 import unittest
 import numpy as np
+import nn
 from itertools import product
-from model import models, MLP
+from unittest import mock
+from model import models, Linear, MLP, FrozenMLP, NumpyMLP, Cached
 from game import games, MNOP
 from azero import AlphaZero
 from nn import loss_fwd
@@ -14,6 +20,38 @@ N = 10
 
 
 class TestModel(unittest.TestCase):
+    def test_lazy_tensorflow(self):
+        code = ('import sys, model, azero, server; '
+                'model.NumpyMLP(9, 18, 2); '
+                'assert "tensorflow" not in sys.modules')
+        subprocess.run([sys.executable, '-c', code], check=True)
+
+    def test_lazy_buffer(self):
+        game = MNOP()
+        model = NumpyMLP(game.n_action, game.n_view, game.n_player, seed=0)
+        self.assertIsNone(model.buffer)
+        self.assertIsNone(model.inference().buffer)
+        azero = AlphaZero(game, model, seed=0, sims_per_search=10)
+        model.update(azero.play_multi(n_games=2))
+        self.assertEqual(model.buffer.capacity, model.buffer_size)
+        self.assertGreater(len(model.buffer), 0)
+
+    def test_numpy_mlp_float32(self):
+        ''' Float32 weights stay float32 through a whole optimizer step '''
+        game = MNOP()
+        model = NumpyMLP(game.n_action, game.n_view, game.n_player, seed=0,
+                         dtype=np.float32)
+        rs = np.random.RandomState(0)
+        obs = rs.rand(8, game.n_view)
+        q = rs.dirichlet(np.ones(game.n_action), size=8)
+        z = rs.randn(8, game.n_player)
+        with mock.patch('model.adam', wraps=nn.adam) as adam:
+            model._sparse_update(obs, q, z)
+        grads = [call[0][1] for call in adam.call_args_list]
+        self.assertEqual(len(grads), len(model.params))
+        for array in grads + model.params + model.m + model.v:
+            self.assertEqual(array.dtype, np.float32)
+
     def test_random_play(self):
         for model_cls, game_cls in product(models, games):
             game = game_cls()
@@ -27,6 +65,26 @@ class TestModel(unittest.TestCase):
                     action = sample_logits(logits, valid)
                     state, player, outcome = game.step(state, player, action)
 
+    def test_model_batch(self):
+        for model_cls, game_cls in product(models, games):
+            game = game_cls()
+            model = model_cls(game.n_action, game.n_view, game.n_player)
+            views = []
+            for _ in range(N):
+                state, player, outcome = game.start()
+                while outcome is None:
+                    views.append(game.view(state, player))
+                    valid = game.valid(state, player)
+                    action = sample_logits((0,) * len(valid), valid)
+                    state, player, outcome = game.step(state, player, action)
+            logits, values = model.model_batch(views)
+            self.assertEqual(logits.shape, (len(views), game.n_action))
+            self.assertEqual(values.shape, (len(views), game.n_player))
+            for obs, l, v in zip(views, logits, values):
+                single_logits, single_values = model.model(obs)
+                np.testing.assert_allclose(l, single_logits, rtol=1e-5)
+                np.testing.assert_allclose(v, single_values, rtol=1e-5)
+
     def test_nan_propagation(self):
         for model_cls, game_cls in product(models, games):
             game = game_cls()
@@ -48,6 +106,69 @@ class TestModel(unittest.TestCase):
                     action = sample_logits(logits, valid)
                     state, player, outcome = game.step(state, player, action)
 
+    def test_frozen_mlp(self):
+        game = MNOP()
+        mlp = MLP(game.n_action, game.n_view, game.n_player)
+        frozen = FrozenMLP.from_mlp(mlp)
+        obs = np.random.RandomState(0).randn(10, game.n_view)
+        for a, b in zip(mlp.model_batch(obs), frozen.model_batch(obs)):
+            np.testing.assert_allclose(a, b, rtol=1e-4, atol=1e-5)
+
+    def test_frozen_load(self):
+        rs = np.random.RandomState(0)
+        A, B, C, D = 5, 4, 3, 2
+        weights = dict(W0=rs.randn(A, B), b0=rs.randn(B),
+                       gamma0=rs.randn(B), beta0=rs.randn(B),
+                       mean0=rs.randn(B), var0=rs.rand(B), eps0=1e-3,
+                       Wp=rs.randn(B, C), bp=rs.randn(C),
+                       Wv=rs.randn(B, D), bv=rs.randn(D), relu=True)
+        obs = rs.randn(10, A)
+        net = obs.dot(weights['W0']) + weights['b0']
+        net = (net - weights['mean0']) / np.sqrt(weights['var0'] + 1e-3)
+        net = np.maximum(net * weights['gamma0'] + weights['beta0'], 0)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'weights.npz')
+            np.savez(path, **weights)
+            model = FrozenMLP.load(path)
+        logits, values = model.model_batch(obs)
+        p = net.dot(weights['Wp']) + weights['bp']
+        v = net.dot(weights['Wv']) + weights['bv']
+        np.testing.assert_allclose(logits, p)
+        np.testing.assert_allclose(values, v)
+
+    def test_cached(self):
+        game = MNOP()
+        model = Linear(game.n_action, game.n_view, game.n_player, seed=0)
+        cached = Cached(model)
+        obs = np.random.RandomState(0).randn(10, game.n_view)
+        for _ in range(3):
+            for a, b in zip(model.model_batch(obs), cached.model_batch(obs)):
+                np.testing.assert_allclose(a, b)
+        self.assertEqual(cached.stats()['misses'], 10)
+        self.assertEqual(cached.stats()['hits'], 20)
+        # Updating the wrapped model invalidates the cache
+        model.W += 1
+        model.n_updates += 1
+        for a, b in zip(model.model_batch(obs), cached.model_batch(obs)):
+            np.testing.assert_allclose(a, b)
+        self.assertEqual(cached.stats()['misses'], 20)
+        # Memory budget is respected
+        small = Cached(model, max_bytes=1000)
+        small.model_batch(obs)
+        self.assertLessEqual(small.nbytes, 1000)
+        self.assertGreater(small.stats()['evictions'], 0)
+        # Updates go to the wrapped model, and only it buffers the games
+        azero = AlphaZero.make(MNOP, NumpyMLP, seed=0)
+        games = azero.play_multi(n_games=2)
+        model = azero._model
+        cached = Cached(model)
+        cached.model_batch(obs)
+        cached.update(games)
+        self.assertIsNone(cached.buffer)
+        self.assertEqual(len(model.buffer), sum(len(t) for t, _ in games))
+        self.assertEqual(model.n_updates, 1)
+        self.assertEqual(len(cached.cache), 0)
+
     def test_mlp_overfit(self):
         azero = AlphaZero.make(MNOP, MLP, seed=0)
         games = azero.play_multi()
@@ -63,6 +184,40 @@ class TestModel(unittest.TestCase):
         true, _ = loss_fwd(np.c_[q, z], q, z, azero._model.c)
         self.assertLess(loss, np.mean(true))
 
+    def test_mlp_dense(self):
+        game = MNOP()
+        model = MLP(game.n_action, game.n_view, game.n_player, seed=0,
+                    dense=True, batch_size=16, n_epochs=20)
+        azero = AlphaZero(game, model, seed=0, sims_per_search=100)
+        games = azero.play_multi()
+        positions = [(o, q, z) for t, z in games for o, q in t]
+        obs, q, z = map(np.array, zip(*positions))
+        before, _ = model._loss(obs, q, z)
+        model.update(games)
+        after, _ = model._loss(obs, q, z)
+        self.assertLess(after, before)
+        self.assertGreater(model.samples_per_sec, 0)
+
+    def test_numpy_mlp(self):
+        azero = AlphaZero.make(MNOP, NumpyMLP, seed=0)
+        games = azero.play_multi()
+        obs, q, z = sample_games(games, rs=azero.rs)
+        model = azero._model
+        first, _ = model._loss(obs, q, z)
+        for _ in range(1000):
+            model._sparse_update(obs, q, z)
+        loss, _ = model._loss(obs, q, z)
+        self.assertLess(loss, first)
+        true, _ = loss_fwd(np.c_[q, z], q, z, model.c)
+        self.assertLess(loss, np.mean(true))
+        # Inference snapshot matches and stays fixed while training
+        frozen = model.inference()
+        for a, b in zip(model.model_batch(obs), frozen.model_batch(obs)):
+            np.testing.assert_allclose(a, b, rtol=1e-4, atol=1e-5)
+        model._sparse_update(obs, q, z)
+        self.assertFalse(np.allclose(model.model_batch(obs)[0],
+                                     frozen.model_batch(obs)[0]))
+
 
 if __name__ == '__main__':
     unittest.main()
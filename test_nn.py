@@ -71,6 +71,33 @@ class TestNN(unittest.TestCase):
         nx = finite_difference(lambda y: nn.loss_fwd(y, q, z, c)[0], x, dout)
         np.testing.assert_allclose(dx, nx, atol=1e-6)
 
+    def test_batchnorm_fold(self):
+        rs = np.random.RandomState(0)
+        A, B, C = 3, 4, 5
+        x = rs.randn(A, B)
+        W = rs.randn(B, C)
+        b = rs.randn(C)
+        gamma, beta, mean = rs.randn(3, C)
+        var = rs.rand(C)
+        eps = 1e-3
+        out, _ = nn.mlp_fwd(x, W, b)
+        norm = (out - mean) / np.sqrt(var + eps) * gamma + beta
+        fW, fb = nn.batchnorm_fold(W, b, gamma, beta, mean, var, eps)
+        folded, _ = nn.mlp_fwd(x, fW, fb)
+        np.testing.assert_allclose(folded, norm)
+
+    def test_adam(self):
+        rs = np.random.RandomState(0)
+        x = rs.randn(3, 4)
+        m = np.zeros_like(x)
+        v = np.zeros_like(x)
+        # Minimize a quadratic, each step moves about lr per element
+        for t in range(1, 1001):
+            old = x.copy()
+            nn.adam(x, 2 * x, m, v, t, lr=0.01)
+            self.assertLess(np.abs(x - old).max(), 0.0101)
+        self.assertLess(np.abs(x).max(), 0.05)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import numpy as np
+from replay import ReplayBuffer, ReplayStore
+
+
+def make_games(rs, n_games, n_obs, n_act, n_val):
+    ''' Random games in the format returned by AlphaZero.play() '''
+    return [([(rs.randn(n_obs), rs.dirichlet(np.ones(n_act)))
+              for _ in range(rs.randint(1, 10))], rs.randn(n_val))
+            for _ in range(n_games)]
+
+
+class TestReplay(unittest.TestCase):
+    def test_buffer(self):
+        rs = np.random.RandomState(0)
+        buffer = ReplayBuffer(4, 3, 2, capacity=50)
+        games = make_games(rs, 20, 4, 3, 2)
+        n = buffer.add_games(games)
+        self.assertEqual(n, sum(len(t) for t, _ in games))
+        self.assertEqual(len(buffer), min(n, 50))
+        # The newest positions are kept, in a ring
+        positions = [(o, q, z) for t, z in games for o, q in t]
+        for k, (o, q, z) in enumerate(positions[-len(buffer):]):
+            i = (n - len(buffer) + k) % 50
+            np.testing.assert_allclose(buffer.obs[i], o, rtol=1e-6)
+            np.testing.assert_allclose(buffer.q[i], q, rtol=1e-6)
+            np.testing.assert_allclose(buffer.z[i], z, rtol=1e-6)
+        obs, q, z = buffer.sample(10, rs=rs)
+        self.assertEqual(obs.shape, (10, 4))
+        self.assertEqual(q.shape, (10, 3))
+        self.assertEqual(z.shape, (10, 2))
+        obs, q, z = buffer.sample(100, rs=rs)
+        self.assertEqual(len(obs), 50)
+
+    def test_sample(self):
+        buffer = ReplayBuffer(1, 1, 1, capacity=10)
+        for i in range(5):
+            buffer.append([i], [i], [i])
+        obs, q, z = buffer.sample(5, rs=np.random.RandomState(0))
+        self.assertEqual(sorted(obs.flatten()), [0, 1, 2, 3, 4])
+
+    def test_store(self):
+        rs = np.random.RandomState(0)
+        games = make_games(rs, 20, 4, 3, 2)
+        positions = [(o, q, z) for t, z in games for o, q in t]
+        with tempfile.TemporaryDirectory() as path:
+            store = ReplayStore(path, 4, 3, 2, shard_size=16)
+            n = store.add_games(iter(games[:10]))
+            reader = ReplayStore(path, readonly=True)
+            self.assertEqual(len(reader), n)
+            # Reopening resumes appending where the store left off
+            store = ReplayStore(path)
+            n += store.add_games(iter(games[10:]))
+            self.assertEqual(n, len(positions))
+            reader.refresh()
+            self.assertEqual(len(reader), n)
+            obs, q, z = reader.records(16, 32)
+            self.assertEqual(obs.shape, (16, 4))
+            for k, (o, p, v) in enumerate(positions[16:32]):
+                np.testing.assert_allclose(obs[k], o, rtol=1e-6)
+                np.testing.assert_allclose(q[k], p, rtol=1e-6)
+                np.testing.assert_allclose(z[k], v, rtol=1e-6)
+            obs, q, z = reader.sample(n, rs=rs)
+            expected = np.array([o for o, _, _ in positions], np.float32)
+            np.testing.assert_array_equal(np.sort(obs, axis=0),
+                                          np.sort(expected, axis=0))
+            self.assertEqual(q.shape, (n, 3))
+            self.assertEqual(z.shape, (n, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import time
+import unittest
+import numpy as np
+from game import MNOP
+from model import Linear
+from azero import AlphaZero
+from server import InferenceServer
+
+
+class TestServer(unittest.TestCase):
+    def test_model(self):
+        game = MNOP()
+        model = Linear(game.n_action, game.n_view, game.n_player, seed=0)
+        obs = np.random.RandomState(0).randn(10, game.n_view)
+        with InferenceServer(model, n_clients=2) as server:
+            for client in server.clients:
+                logits, values = client.model_batch(obs)
+                np.testing.assert_allclose(logits, model.model_batch(obs)[0])
+                np.testing.assert_allclose(values, model.model_batch(obs)[1])
+                logits, values = client.model(obs[0])
+                np.testing.assert_allclose(logits, model.model(obs[0])[0])
+                np.testing.assert_allclose(values, model.model(obs[0])[1])
+        stats = server.stats()
+        self.assertEqual(stats['requests'], 4)
+        self.assertLessEqual(stats['max_batch_size'], server.max_batch)
+        self.assertGreaterEqual(stats['mean_latency'], 0)
+
+    def test_multi_obs(self):
+        game = MNOP()
+        model = Linear(game.n_action, game.n_view, game.n_player, seed=0)
+        server = InferenceServer(model, n_clients=2, max_batch=4,
+                                 timeout=0.1)
+        rs = np.random.RandomState(0)
+        sizes = [3, 1, 3, 6, 1]
+        requests = [(i % 2, rs.randn(n, game.n_view)) for i, n in
+                    enumerate(sizes)]
+        for index, obs in requests:  # Queued before the server starts
+            server.requests.put((index, obs, time.time()))
+        with server:
+            for index, obs in requests:
+                logits, values = server.clients[index].responses.get()
+                np.testing.assert_allclose(logits, model.model_batch(obs)[0])
+                np.testing.assert_allclose(values, model.model_batch(obs)[1])
+        # Requests that don't fit wait for the next batch, and only the one
+        # bigger than max_batch on its own goes past it
+        stats = server.stats()
+        self.assertEqual(stats['batches'], 4)  # [3, 1], [3], [6], [1]
+        self.assertEqual(stats['max_batch_size'], 6)
+        self.assertEqual(stats['mean_batch_size'], sum(sizes) / 4)
+
+    def test_play_parallel(self):
+        game = MNOP()
+        model = Linear(game.n_action, game.n_view, game.n_player, seed=0)
+        azero = AlphaZero(game, model, seed=0, sims_per_search=10)
+        with InferenceServer(model, n_clients=2, max_batch=2) as server:
+            games = azero.play_multi(n_games=4, n_workers=2, server=server)
+        self.assertEqual(len(games), 4)
+        for trajectory, outcome in games:
+            self.assertEqual(len(outcome), game.n_player)
+        stats = server.stats()
+        self.assertGreater(stats['requests'], 0)
+        self.assertLessEqual(stats['max_batch_size'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
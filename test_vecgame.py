@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import unittest
+import numpy as np
+from game import MNOP, BitConnect3, Nim
+from vecgame import VecMNOP, VecConnect3, VecNim
+
+N = 100
+
+
+class TestVecGames(unittest.TestCase):
+    def check_games(self, vec, game, n_steps=N):
+        ''' Play random games with vec and one game per env, compare '''
+        rs = np.random.RandomState(0)
+        players = vec.start()
+        games = [game.start() for _ in range(vec.n_envs)]
+        for _ in range(n_steps):
+            valid = vec.valid()
+            view = vec.view()
+            self.assertEqual(valid.shape, (vec.n_envs, game.n_action))
+            self.assertEqual(view.shape, (vec.n_envs, game.n_view))
+            actions = []
+            for i, (state, player, _) in enumerate(games):
+                self.assertEqual(players[i], player)
+                self.assertEqual(vec.state(i), tuple(state))
+                np.testing.assert_equal(valid[i], game.valid(state, player))
+                np.testing.assert_equal(view[i],
+                                        game.view(state, player).flatten())
+                actions.append(rs.choice(np.flatnonzero(valid[i])))
+            players, outcome, done = vec.step(actions)
+            for i, action in enumerate(actions):
+                state, player, _ = games[i]
+                state, player, out = game.step(state, player, action)
+                self.assertEqual(done[i], out is not None)
+                if out is None:
+                    games[i] = state, player, out
+                else:
+                    np.testing.assert_equal(outcome[i], out)
+                    games[i] = game.start()
+
+    def test_mnop(self):
+        self.check_games(VecMNOP(10), MNOP())
+        self.check_games(VecMNOP(5, 4, 4, 3, 3), MNOP(4, 4, 3, 3))
+
+    def test_connect3(self):
+        self.check_games(VecConnect3(10), BitConnect3())
+
+    def test_nim(self):
+        self.check_games(VecNim(10), Nim())
+        self.check_games(VecNim(5, (2, 3), 3), Nim((2, 3), 3))
+
+    def test_invalid(self):
+        vec = VecMNOP(2)
+        vec.step([0, 0])
+        with self.assertRaises(AssertionError):
+            vec.step([0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
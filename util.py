@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+import queue
+import threading
 import numpy as np
 from itertools import tee
 
@@ -28,6 +30,32 @@ def sample_probs(probs, rs=np.random):
 
 def sample_games(games, rs=np.random):
     ''' Return (observation, probabilities, outcomes) arrays for training '''
-    s = sum([[(o, q, z) for o, q in t] for t, z in games], [])
+    s = [(o, q, z) for t, z in games for o, q in t]
     d = [s[i] for i in rs.choice(len(s), len(games), replace=False)]
     return map(np.array, zip(*d))
+
+
+def game_arrays(games, dtype=np.float32):
+    ''' Return (observation, probabilities, outcomes) of every position '''
+    obs = np.array([np.ravel(o) for t, _ in games for o, _ in t], dtype=dtype)
+    q = np.array([p for t, _ in games for _, p in t], dtype=dtype)
+    z = np.array([v for t, v in games for _ in t], dtype=dtype)
+    return obs, q, z
+
+
+def prefetch(iterable, size=2):
+    ''' Iterate in a background thread, keeping up to size items ready '''
+    items = queue.Queue(maxsize=size)
+    done = object()
+
+    def fill():
+        for item in iterable:
+            items.put(item)
+        items.put(done)
+
+    threading.Thread(target=fill, daemon=True).start()
+    while True:
+        item = items.get()
+        if item is done:
+            return
+        yield item
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+
+import numpy as np
+from itertools import product
+from game import BitConnect3, MNOP, Nim
+
+
+def line_table(lines, n_cells):
+    '''
+    Build a (n_cells, most lines through a cell, line length) index array
+    of the lines through each cell.  Rows are padded with lines of the
+    sentinel cell n_cells, which never belongs to a player.
+    '''
+    through = [[line for line in lines if k in line] for k in range(n_cells)]
+    width = max(len(t) for t in through)
+    table = np.full((n_cells, width, len(lines[0])), n_cells, dtype=int)
+    for k, t in enumerate(through):
+        table[k, :len(t)] = t
+    return table
+
+
+class VecGame:
+    '''
+    Interface class for a batch of games of the same kind, held as stacked
+    arrays and advanced together with one array operation per call.
+    Games that end are immediately restarted.
+    '''
+
+    def __init__(self, game, n_envs):
+        '''
+            game - single game of the same kind, for sizes and human()
+            n_envs - number of games to play at once
+        '''
+        self.game = game
+        self.n_envs = n_envs
+        self.n_action = game.n_action
+        self.n_view = game.n_view
+        self.n_player = game.n_player
+        self.index = np.arange(n_envs)
+        self.player = np.zeros(n_envs, dtype=int)
+
+    def start(self):
+        '''
+        Start all the games, returns
+            player - index of the next player in each game
+        '''
+        self._reset(np.ones(self.n_envs, dtype=bool))
+        return self.player.copy()
+
+    def step(self, actions):
+        '''
+        Advance every game by one turn
+            actions - move to be played next in each game
+        Returns
+            player - next player index in each game (after any restart)
+            outcome - (n_envs, n_player) rewards, zero for games not over
+            done - boolean mask of the games that ended (and restarted)
+        '''
+        actions = np.asarray(actions, dtype=int)
+        assert actions.shape == (self.n_envs,)
+        assert self.valid()[self.index, actions].all(), 'Invalid action'
+        win, tie = self._step(actions)
+        outcome = np.zeros((self.n_envs, self.n_player))
+        outcome[win] = -1
+        outcome[win, self.player[win]] = self.n_player - 1
+        done = win | tie
+        self.player = (self.player + 1) % self.n_player
+        self._reset(done)
+        return self.player.copy(), outcome, done
+
+    def valid(self):
+        ''' (n_envs, n_action) boolean mask of valid actions '''
+        raise NotImplementedError('Implement in subclass')
+
+    def view(self):
+        ''' (n_envs, n_view) observations of the current players '''
+        raise NotImplementedError('Implement in subclass')
+
+    def state(self, i):
+        ''' State of game i, as used by the single game '''
+        raise NotImplementedError('Implement in subclass')
+
+    def _reset(self, mask):
+        raise NotImplementedError('Implement in subclass')
+
+    def _step(self, actions):
+        ''' Play actions, return (win, tie) boolean masks '''
+        raise NotImplementedError('Implement in subclass')
+
+
+class VecMNOP(VecGame):
+    ''' Batch of generalized tic-tac-toe games, see game.MNOP '''
+
+    def __init__(self, n_envs, m=3, n=3, o=3, p=2):
+        super().__init__(MNOP(m, n, o, p), n_envs)
+        self.n_cells = m * n
+        # Cell k = i * m + j for row i < n and column j < m, plus a sentinel
+        self.board = np.full((n_envs, self.n_cells + 1), -2, dtype=np.int8)
+        lines = []
+        for i, j, (di, dj) in product(range(n), range(m),
+                                      ((0, 1), (1, 0), (1, 1), (1, -1))):
+            cells = [(i + di * k, j + dj * k) for k in range(o)]
+            if all(0 <= a < n and 0 <= b < m for a, b in cells):
+                lines.append([a * m + b for a, b in cells])
+        self.lines = line_table(lines, self.n_cells)
+        self.start()
+
+    def _reset(self, mask):
+        self.board[mask, :self.n_cells] = -1
+        self.player[mask] = 0
+
+    def _step(self, actions):
+        self.board[self.index, actions] = self.player
+        lines = self.board[self.index[:, None, None], self.lines[actions]]
+        win = (lines == self.player[:, None, None]).all(axis=2).any(axis=1)
+        tie = ~win & (self.board[:, :self.n_cells] != -1).all(axis=1)
+        return win, tie
+
+    def valid(self):
+        return self.board[:, :self.n_cells] == -1
+
+    def view(self):
+        # Channel c holds the pieces of the c-th player after the current one
+        owner = (self.player[:, None] + np.arange(self.n_player)) % \
+            self.n_player
+        view = self.board[:, None, :self.n_cells] == owner[:, :, None]
+        return view.reshape(self.n_envs, self.n_view).astype(float)
+
+    def state(self, i):
+        return tuple(self.board[i, :self.n_cells].tolist())
+
+
+class VecConnect3(VecGame):
+    ''' Batch of Connect3 games, views are the same as game.BitConnect3 '''
+
+    def __init__(self, n_envs):
+        super().__init__(BitConnect3(), n_envs)
+        # Cell (column, row) is 4 * column + row, plus a sentinel
+        self.board = np.full((n_envs, 21), -2, dtype=np.int8)
+        self.heights = np.zeros((n_envs, 5), dtype=int)
+        lines = []
+        for x, y, (dx, dy) in product(range(5), range(4),
+                                      ((1, 0), (0, 1), (1, 1), (1, -1))):
+            cells = [(x + dx * k, y + dy * k) for k in range(3)]
+            if all(0 <= a < 5 and 0 <= b < 4 for a, b in cells):
+                lines.append([4 * a + b for a, b in cells])
+        self.lines = line_table(lines, 20)
+        self.start()
+
+    def _reset(self, mask):
+        self.board[mask, :20] = -1
+        self.heights[mask] = 0
+        self.player[mask] = 0
+
+    def _step(self, actions):
+        cells = 4 * actions + self.heights[self.index, actions]
+        self.heights[self.index, actions] += 1
+        self.board[self.index, cells] = self.player
+        lines = self.board[self.index[:, None, None], self.lines[cells]]
+        win = (lines == self.player[:, None, None]).all(axis=2).any(axis=1)
+        tie = ~win & (self.heights == 4).all(axis=1)
+        return win, tie
+
+    def valid(self):
+        return self.heights < 4
+
+    def view(self):
+        owner = np.stack([self.player, 1 - self.player], axis=1)
+        view = self.board[:, None, :20] == owner[:, :, None]
+        return view.reshape(self.n_envs, self.n_view).astype(float)
+
+    def state(self, i):
+        return tuple(int(sum(1 << k for k in np.flatnonzero(
+            self.board[i, :20] == p))) for p in range(2))
+
+
+class VecNim(VecGame):
+    ''' Batch of Nim games, see game.Nim '''
+
+    def __init__(self, n_envs, s=(3, 5, 7), p=2):
+        super().__init__(Nim(s, p), n_envs)
+        self.s = np.array(s)
+        self.mp = max(s)
+        self.piles = np.zeros((n_envs, len(s)), dtype=int)
+        self.stones = np.arange(self.mp)
+        self.start()
+
+    def _reset(self, mask):
+        self.piles[mask] = self.s
+        self.player[mask] = 0
+
+    def _step(self, actions):
+        pile, j = np.divmod(actions, self.mp)
+        self.piles[self.index, pile] = j
+        win = ~self.piles.any(axis=1)
+        return win, np.zeros(self.n_envs, dtype=bool)
+
+    def valid(self):
+        valid = self.stones < self.piles[:, :, None]
+        return valid.reshape(self.n_envs, self.n_action)
+
+    def view(self):
+        view = np.empty((self.n_envs, self.n_view))
+        view[:, :-1] = self.valid()
+        view[:, -1] = self.player
+        return view
+
+    def state(self, i):
+        return tuple(self.piles[i].tolist()) + (int(self.player[i]),)